@@ -34,8 +34,11 @@ async def end_maintenance(request: Request, _=Depends(verify_admin)) -> Dict:
 
 @router.post("/cache/clear")
 async def clear_cache(request: Request, _=Depends(verify_admin)) -> Dict:
-    from app.api.routes import rf_cache
+    from app.api.routes import context_enhancer, response_cache, rf_cache
     rf_cache.clear_all()
+    context_enhancer.clear_memo()
+    # 古いRF情報をもとにした応答も返さない
+    response_cache.clear()
     logger.info(
         "Cache cleared by admin",
         extra={"request_id": request.state.request_id}
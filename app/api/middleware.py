@@ -1,53 +1,86 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from config import get_logger
+from typing import Optional
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.maintenance import maintenance
+from app.core.metrics import REQUESTS_IN_PROGRESS, observe_request
+from app.core.middleware import SECURITY_HEADERS, security_policy
+from app.core.rate_limit import rate_limiter
+from app.core import timing
+from config import get_logger, get_settings
+import logging
 import time
 import uuid
 
 logger = get_logger()
+settings = get_settings()
 
-class RequestMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        request_id = str(uuid.uuid4())
-        request.state.request_id = request_id
+class GatewayMiddleware:
+    """リクエストID・処理時間・セキュリティ検証・メンテナンス判定をまとめた純粋なASGIミドルウェア
 
-        # リクエスト開始時間
-        start_time = time.time()
-
-        # リクエストログ
-        logger.info(
-            f"Incoming request: {request.method} {request.url.path}",
-            extra={
-                "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
-                "client_ip": request.client.host
-            }
-        )
+    BaseHTTPMiddlewareと違いタスクやストリームのラップを行わないため、
+    ストリーミングレスポンスもそのまま通過する。
+    """
 
-        try:
-            response = await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = str(uuid.uuid4())
+        scope.setdefault("state", {})["request_id"] = request_id
 
-            # レスポンス時間の計算
-            process_time = time.time() - start_time
+        # リクエスト開始時間
+        start_time = time.perf_counter()
+        method = scope["method"]
+        path = scope["path"]
+        client = scope.get("client")
+        client_ip = client[0] if client else None
 
+        # リクエストログ（無効なレベルでは引数の組み立ても行わない）
+        log_info = logger.isEnabledFor(logging.INFO)
+        if log_info:
             logger.info(
-                f"Request completed in {process_time:.3f}s",
+                "Incoming request: %s %s", method, path,
                 extra={
                     "request_id": request_id,
-                    "status_code": response.status_code,
-                    "process_time": process_time
+                    "method": method,
+                    "path": path,
+                    "client_ip": client_ip
                 }
             )
 
-            response.headers["X-Request-ID"] = request_id
-            response.headers["X-Process-Time"] = str(process_time)
+        status_code = 500
+        REQUESTS_IN_PROGRESS.inc()
+        timing_token = timing.start_request() if settings.SERVER_TIMING else None
 
-            return response
+        async def send_with_headers(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                elapsed = time.perf_counter() - start_time
+                headers["X-Request-ID"] = request_id
+                headers["X-Process-Time"] = str(elapsed)
+                request_timing = timing.current()
+                if request_timing is not None:
+                    headers["Server-Timing"] = request_timing.header_value(elapsed)
+                for name, value in SECURITY_HEADERS:
+                    headers[name] = value
+            await send(message)
 
+        try:
+            rejection = self._check_request(path, client_ip, scope)
+            if rejection is not None:
+                await rejection(scope, receive, send_with_headers)
+            else:
+                await self.app(scope, receive, send_with_headers)
         except Exception as e:
             logger.error(
-                f"Request failed: {str(e)}",
+                "Request failed: %s", e,
                 extra={
                     "request_id": request_id,
                     "error": str(e)
@@ -55,3 +88,40 @@ class RequestMiddleware(BaseHTTPMiddleware):
                 exc_info=True
             )
             raise
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            if timing_token is not None:
+                timing.end_request(timing_token)
+            # ルーティング後はパスのテンプレートをラベルにする（未一致のパスは1つにまとめる）
+            route = getattr(scope.get("route"), "path", "unmatched")
+            observe_request(route, status_code, time.perf_counter() - start_time)
+
+        # レスポンス時間の計算
+        process_time = time.perf_counter() - start_time
+        if log_info:
+            logger.info(
+                "Request completed in %.3fs", process_time,
+                extra={
+                    "request_id": request_id,
+                    "status_code": status_code,
+                    "process_time": process_time
+                }
+            )
+
+    def _check_request(self, path: str, client_ip: Optional[str], scope: Scope) -> Optional[JSONResponse]:
+        # メンテナンスモード中は許可されたパス以外を拒否する
+        if maintenance.blocks(path):
+            return maintenance.response()
+
+        headers = Headers(scope=scope)
+        rejected = security_policy.check(client_ip, headers)
+        if rejected is not None:
+            status_code, detail = rejected
+            return JSONResponse(status_code=status_code, content={"detail": detail})
+
+        if settings.RATE_LIMIT_ENABLED:
+            limited = rate_limiter.check(path, client_ip, headers)
+            if limited is not None:
+                status_code, detail, limit_headers = limited
+                return JSONResponse(status_code=status_code, content={"detail": detail}, headers=limit_headers)
+        return None
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Request, Depends, HTTPException
-from app.models.messages import MCPRequest, MCPResponse
-from app.services import RFClient, ClaudeClient, ContextEnhancer, RFCache
-from app.core.exceptions import MCPError
+from fastapi import APIRouter, Request, Response, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from app.models.messages import MCPRequest, MCPResponse, Usage
+from app.services import RFClient, ClaudeClient, ContextEnhancer, RFCache, ResponseCache
+from app.services.context_enhancer import EnrichmentReport
+from app.core.exceptions import MCPError, OverloadedError, ValidationError
+from app.core import timing
+from app.core.metrics import render_metrics
+from app.core.rate_limit import rate_limiter
 from config import get_logger, get_settings
-from typing import Dict
+from typing import Dict, Optional
 
 router = APIRouter()
 logger = get_logger()
@@ -14,23 +19,92 @@ rf_cache = RFCache()
 rf_client = RFClient(rf_cache)
 claude_client = ClaudeClient()
 context_enhancer = ContextEnhancer(rf_client)
+response_cache = ResponseCache()
+
+def get_enrichment_deadline(mcp_request: MCPRequest) -> Optional[float]:
+    """エンリッチメントの期限（秒）。metadata.enrichment_deadline_ms で上書きできる"""
+    deadline_ms = (mcp_request.metadata or {}).get("enrichment_deadline_ms")
+    # null（未指定と同じ）は既定値を使う
+    if deadline_ms is None:
+        deadline_ms = settings.ENRICH_DEADLINE_MS
+    try:
+        deadline_ms = float(deadline_ms)
+    except (TypeError, ValueError):
+        raise ValidationError(
+            "enrichment_deadline_ms must be a number",
+            details={"enrichment_deadline_ms": deadline_ms}
+        )
+    return deadline_ms / 1000 if deadline_ms > 0 else None
 
 @router.post("/v1/messages", response_model=MCPResponse)
-async def create_message(request: Request, mcp_request: MCPRequest):
+async def create_message(request: Request, response: Response, mcp_request: MCPRequest):
     request_id = request.state.request_id
     logger.info(f"Processing message request", extra={"request_id": request_id})
 
     try:
-        # メッセージの強化
-        enhanced_messages = await context_enhancer.enhance_messages(mcp_request.messages)
+        # メッセージの強化（期限内に揃ったRF情報のみ使用する）
+        report = EnrichmentReport()
+        with timing.stage("enrich"):
+            enhanced_messages = await context_enhancer.enhance_messages(
+                mcp_request.messages,
+                deadline=get_enrichment_deadline(mcp_request),
+                report=report
+            )
+        response.headers["X-RF-Enrichment"] = report.header_value()
+
+        # ストリーミング応答（SSEをそのまま中継し、使用量は終了時に記録する）
+        if mcp_request.stream:
+            def log_usage(usage: Usage):
+                logger.info(
+                    "Message stream completed",
+                    extra={
+                        "request_id": request_id,
+                        "model": mcp_request.model,
+                        "input_tokens": usage.input_tokens,
+                        "output_tokens": usage.output_tokens,
+                        "cache_read_input_tokens": usage.cache_read_input_tokens,
+                        "cache_creation_input_tokens": usage.cache_creation_input_tokens
+                    }
+                )
+
+            # ストリーミングでは最初のレスポンスヘッダーを受け取るまでの時間を計測する
+            with timing.stage("claude"):
+                events = await claude_client.stream_message(
+                    messages=enhanced_messages,
+                    model=mcp_request.model,
+                    max_tokens=mcp_request.max_tokens,
+                    temperature=mcp_request.temperature,
+                    system=mcp_request.system,
+                    on_complete=log_usage
+                )
+            return StreamingResponse(
+                events,
+                media_type="text/event-stream",
+                headers={
+                    "Cache-Control": "no-cache",
+                    "X-Accel-Buffering": "no",
+                    "X-RF-Enrichment": report.header_value()
+                }
+            )
+
+        # 同一リクエストの応答キャッシュ（RFの情報が全て揃った場合のみ使う）
+        cache_key = response_cache.cache_key(mcp_request, enhanced_messages) if report.skipped == 0 else None
+        if cache_key is not None:
+            directives = response_cache.directives(request.headers.get("cache-control"))
+            cache_status, cached_body = response_cache.lookup(cache_key, directives)
+            cache_headers = {"X-RF-Enrichment": report.header_value(), "X-Response-Cache": cache_status}
+            if cached_body is not None:
+                return Response(content=cached_body, media_type="application/json", headers=cache_headers)
 
         # Claudeでの処理
-        response = await claude_client.create_message(
-            messages=enhanced_messages,
-            model=mcp_request.model,
-            max_tokens=mcp_request.max_tokens,
-            temperature=mcp_request.temperature
-        )
+        with timing.stage("claude"):
+            mcp_response = await claude_client.create_message(
+                messages=enhanced_messages,
+                model=mcp_request.model,
+                max_tokens=mcp_request.max_tokens,
+                temperature=mcp_request.temperature,
+                system=mcp_request.system
+            )
 
         logger.info(
             "Message processed successfully",
@@ -40,14 +114,22 @@ async def create_message(request: Request, mcp_request: MCPRequest):
             }
         )
 
-        return response
+        if cache_key is not None:
+            body = mcp_response.model_dump_json().encode("utf-8")
+            response_cache.store(cache_key, body, directives)
+            return Response(content=body, media_type="application/json", headers=cache_headers)
+
+        return mcp_response
 
     except MCPError as e:
         logger.error(
             f"MCP error while processing message: {str(e)}",
             extra={"request_id": request_id, "error_type": e.error_type}
         )
-        raise HTTPException(status_code=e.status_code, detail=str(e))
+        headers = None
+        if isinstance(e, OverloadedError):
+            headers = {"Retry-After": str(e.retry_after)}
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
     except Exception as e:
         logger.error(
             f"Unexpected error while processing message: {str(e)}",
@@ -65,5 +147,22 @@ async def health_check(request: Request) -> Dict:
             "ip": len(rf_cache.ip_cache),
             "domain": len(rf_cache.domain_cache),
             "vulnerability": len(rf_cache.vulnerability_cache)
-        }
+        },
+        "rf_stats": rf_client.get_stats(),
+        "claude_limiter": claude_client.limiter.get_stats(),
+        "rate_limit": rate_limiter.get_stats(),
+        "rf_circuit_breakers": rf_client.breaker_states(),
+        "rf_pacer": rf_client.pacer.get_stats(),
+        "connection_pools": {
+            "rf": rf_client.pool_stats(),
+            "claude": claude_client.pool_stats()
+        },
+        "enrichment_stats": context_enhancer.get_stats(),
+        "response_cache": response_cache.get_stats()
     }
+
+@router.get("/metrics")
+async def metrics() -> Response:
+    # Prometheus形式（gunicornの全ワーカー分を合算）
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -40,3 +40,13 @@ class ValidationError(MCPError):
             status_code=400,
             details=details
         )
+
+class OverloadedError(MCPError):
+    def __init__(self, message: str, retry_after: int = 1, details: Optional[Dict[str, Any]] = None):
+        super().__init__(
+            error_type="overloaded",
+            message=message,
+            status_code=503,
+            details={"retry_after": retry_after, **(details or {})}
+        )
+        self.retry_after = retry_after
@@ -1,5 +1,7 @@
-from .exceptions import MCPError, RFAPIException, ClaudeAPIException, ValidationError
-from .maintenance import maintenance, setup_maintenance_middleware
+from .exceptions import MCPError, RFAPIException, ClaudeAPIException, ValidationError, OverloadedError
+from .maintenance import maintenance
+from .middleware import security_policy
+from .rate_limit import rate_limiter
 from .security import security_handler
 
 __all__ = [
@@ -7,7 +9,9 @@ __all__ = [
     'RFAPIException',
     'ClaudeAPIException',
     'ValidationError',
+    'OverloadedError',
     'maintenance',
-    'setup_maintenance_middleware',
+    'security_policy',
+    'rate_limiter',
     'security_handler'
 ]
@@ -1,5 +1,4 @@
 from typing import Set
-from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from config import get_logger
 
@@ -25,18 +24,17 @@ class MaintenanceMode:
     def is_path_allowed(self, path: str) -> bool:
         return path in self._allowed_paths
 
-maintenance = MaintenanceMode()
+    def blocks(self, path: str) -> bool:
+        return self._is_active and path not in self._allowed_paths
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "error": "System under maintenance",
+                "type": "maintenance_error",
+                "message": "The system is currently under maintenance"
+            }
+        )
 
-def setup_maintenance_middleware(app: FastAPI):
-    @app.middleware("http")
-    async def maintenance_middleware(request: Request, call_next):
-        if maintenance.is_active and not maintenance.is_path_allowed(request.url.path):
-            return JSONResponse(
-                status_code=503,
-                content={
-                    "error": "System under maintenance",
-                    "type": "maintenance_error",
-                    "message": "The system is currently under maintenance"
-                }
-            )
-        return await call_next(request)
+maintenance = MaintenanceMode()
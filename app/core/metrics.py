@@ -0,0 +1,120 @@
+"""Prometheusメトリクス
+
+gunicornの各ワーカーは PROMETHEUS_MULTIPROC_DIR 配下のmmapファイルに書き込み、
+/metrics ではそれらを合算して出力する（gunicorn.conf.py で設定する）。
+ラベル付きの子メトリクスは初回のみ生成し、以降はキャッシュから取り出す。
+"""
+import os
+from typing import Dict, Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+from app.models.messages import Usage
+
+# リクエスト全体・上流API呼び出し用
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# IOC抽出などプロセス内の処理用
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+REQUEST_LATENCY = Histogram(
+    "mcp_request_duration_seconds",
+    "Total request latency",
+    ["route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+IOC_EXTRACTION_LATENCY = Histogram(
+    "mcp_ioc_extraction_duration_seconds",
+    "IOC extraction latency per message",
+    buckets=FAST_BUCKETS
+)
+RF_LOOKUP_LATENCY = Histogram(
+    "mcp_rf_lookup_duration_seconds",
+    "Recorded Future upstream request latency",
+    ["ioc_type"],
+    buckets=LATENCY_BUCKETS
+)
+CLAUDE_LATENCY = Histogram(
+    "mcp_claude_request_duration_seconds",
+    "Claude API request latency (streams are measured until the last event)",
+    ["mode"],
+    buckets=LATENCY_BUCKETS
+)
+RF_RESPONSES = Counter(
+    "mcp_rf_responses_total",
+    "Recorded Future upstream responses by status code",
+    ["status"]
+)
+CLAUDE_RESPONSES = Counter(
+    "mcp_claude_responses_total",
+    "Claude API responses by status code",
+    ["status"]
+)
+CLAUDE_TOKENS = Counter(
+    "mcp_claude_tokens_total",
+    "Claude token usage",
+    ["model", "type"]
+)
+RESPONSE_CACHE_REQUESTS = Counter(
+    "mcp_response_cache_requests_total",
+    "Response cache lookups by result",
+    ["result"]
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "mcp_requests_in_progress",
+    "HTTP requests currently being processed",
+    multiprocess_mode="livesum"
+)
+RF_IN_PROGRESS = Gauge(
+    "mcp_rf_requests_in_progress",
+    "Recorded Future upstream requests in flight",
+    multiprocess_mode="livesum"
+)
+CLAUDE_IN_PROGRESS = Gauge(
+    "mcp_claude_requests_in_progress",
+    "Claude API requests in flight",
+    multiprocess_mode="livesum"
+)
+
+_children: Dict[Tuple, object] = {}
+
+def labelled(metric, *values: str):
+    """ラベル付きの子メトリクスを返す（labels() のロックと文字列変換を毎回行わない）"""
+    key = (metric, values)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*values)
+    return child
+
+def observe_request(route: str, status_code: int, seconds: float):
+    labelled(REQUEST_LATENCY, route, str(status_code)).observe(seconds)
+
+def observe_rf_response(ioc_type: str, status: str, seconds: float):
+    labelled(RF_LOOKUP_LATENCY, ioc_type).observe(seconds)
+    labelled(RF_RESPONSES, status).inc()
+
+def observe_claude_response(mode: str, status: str, seconds: float):
+    labelled(CLAUDE_LATENCY, mode).observe(seconds)
+    labelled(CLAUDE_RESPONSES, status).inc()
+
+def record_tokens(model: str, usage: Usage):
+    labelled(CLAUDE_TOKENS, model, "input").inc(usage.input_tokens)
+    labelled(CLAUDE_TOKENS, model, "output").inc(usage.output_tokens)
+    # プロンプトキャッシュへの書き込み・キャッシュからの読み込み
+    labelled(CLAUDE_TOKENS, model, "cache_creation").inc(usage.cache_creation_input_tokens)
+    labelled(CLAUDE_TOKENS, model, "cache_read").inc(usage.cache_read_input_tokens)
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheusのテキスト形式で全メトリクスを出力する"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
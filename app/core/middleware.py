@@ -1,40 +1,41 @@
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
+from typing import List, Optional, Tuple
+from starlette.datastructures import Headers
 from config import get_logger, get_settings
-import time
 
 logger = get_logger()
 settings = get_settings()
 
-class SecurityMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+# 全レスポンスに付与するセキュリティヘッダー（XSS対策など）
+SECURITY_HEADERS: List[Tuple[str, str]] = [
+    ("X-XSS-Protection", "1; mode=block"),
+    ("X-Content-Type-Options", "nosniff"),
+    ("X-Frame-Options", "DENY"),
+]
+
+class SecurityPolicy:
+    """リクエスト元IPとヘッダーの検証（GatewayMiddlewareから呼ばれる）"""
+
+    required_headers = ["user-agent"]
+
+    def check(self, client_ip: Optional[str], headers: Headers) -> Optional[Tuple[int, str]]:
+        """拒否する場合は (ステータスコード, 詳細) を返す"""
         # リクエスト元IPのチェック
-        client_ip = request.client.host
-        if self._is_blocked_ip(client_ip):
+        if client_ip is not None and self._is_blocked_ip(client_ip):
             logger.warning(f"Blocked IP attempt: {client_ip}")
-            raise HTTPException(status_code=403, detail="Access denied")
+            return 403, "Access denied"
 
         # リクエストヘッダーの検証
-        self._validate_headers(request)
-
-        # XSS対策ヘッダーの追加
-        response = await call_next(request)
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-
-        return response
+        return self._validate_headers(headers)
 
     def _is_blocked_ip(self, ip: str) -> bool:
         # IPブラックリストのチェック
         return False
 
-    def _validate_headers(self, request: Request):
+    def _validate_headers(self, headers: Headers) -> Optional[Tuple[int, str]]:
         # 必須ヘッダーのチェック
-        required_headers = ["user-agent"]
-        for header in required_headers:
-            if header not in request.headers:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Missing required header: {header}"
-                )
+        for header in self.required_headers:
+            if header not in headers:
+                return 400, f"Missing required header: {header}"
+        return None
+
+security_policy = SecurityPolicy()
@@ -1,26 +1,200 @@
-from fastapi import Request, HTTPException
-from datetime import datetime, timedelta
-from typing import Dict, Tuple
+"""トークンバケットによるレート制限
+
+バケットは「送信元（IPまたは登録済みAPIキー）× ルート」ごとに持ち、
+補充レートとバースト上限はルート・APIキーごとのポリシーで決める。
+保存先はワーカー内のLRU（BucketStore）か、全ワーカーで共有する
+mmapファイル上の固定サイズのハッシュ表（SharedBucketStore）のどちらか。
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
 import time
+from collections import OrderedDict
+from starlette.datastructures import Headers
+from typing import Dict, NamedTuple, Optional, Tuple
+from config import get_logger, get_settings
+
+logger = get_logger()
+settings = get_settings()
+
+class RateLimitPolicy(NamedTuple):
+    rate: float  # 1秒あたりの補充トークン数
+    burst: int  # バケットの容量
+
+    @classmethod
+    def from_config(cls, config: Dict[str, float]) -> "RateLimitPolicy":
+        return cls(rate=float(config["rate"]), burst=int(config["burst"]))
+
+    @property
+    def refill_time(self) -> float:
+        # 空のバケットが満杯に戻るまでの秒数（これより長く使われないバケットは捨ててよい）
+        return self.burst / self.rate
+
+def _take(tokens: float, last: float, now: float, policy: RateLimitPolicy) -> Tuple[bool, float, float]:
+    """補充してから1トークン消費する。(許可, 残りトークン, 再試行までの秒数) を返す"""
+    tokens = min(float(policy.burst), tokens + (now - last) * policy.rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / policy.rate
+
+class BucketStore:
+    """ワーカー内のバケット（LRU順のOrderedDict）
+
+    満杯に戻るまで放置されたバケットは新規作成と同じなので、新しいキーの追加時に
+    先頭（最も古い）から期限切れのものを捨て、上限を超えたら最も古いものを捨てる。
+    """
+
+    def __init__(self, max_keys: int, idle_ttl: float):
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, policy: RateLimitPolicy, now: float) -> Tuple[bool, float, float]:
+        buckets = self._buckets
+        state = buckets.get(key)
+        if state is None:
+            tokens, last = float(policy.burst), now
+            self._evict(now)
+        else:
+            tokens, last = state
+            buckets.move_to_end(key)
+        allowed, tokens, retry_after = _take(tokens, last, now, policy)
+        buckets[key] = (tokens, now)
+        return allowed, tokens, retry_after
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        for _ in range(2):
+            if not buckets:
+                return
+            key, (_, last) = next(iter(buckets.items()))
+            if now - last <= self.idle_ttl:
+                break
+            del buckets[key]
+        while len(buckets) >= self.max_keys:
+            buckets.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+class SharedBucketStore:
+    """全ワーカーで共有するバケット（/dev/shm などのファイルをmmapした固定サイズのハッシュ表）
+
+    スロットは (キーのハッシュ, トークン数, 最終更新時刻)。衝突時は PROBE_LENGTH 個先まで探し、
+    見つからなければその中で最も古いスロットを上書きするため、メモリ使用量は固定。
+    更新はファイルロックで直列化する。
+    """
+
+    SLOT = struct.Struct("<Qdd")
+    PROBE_LENGTH = 8
+
+    def __init__(self, path: str, max_keys: int):
+        self.slots = max_keys
+        size = self.SLOT.size * max_keys
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size != size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def take(self, key: str, policy: RateLimitPolicy, now: float) -> Tuple[bool, float, float]:
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        start = key_hash % self.slots
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            offset, tokens, last = self._find(key_hash, start, now, policy)
+            allowed, tokens, retry_after = _take(tokens, last, now, policy)
+            self.SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        return allowed, tokens, retry_after
+
+    def _find(self, key_hash: int, start: int, now: float, policy: RateLimitPolicy) -> Tuple[int, float, float]:
+        victim, victim_last = None, math.inf
+        for i in range(self.PROBE_LENGTH):
+            offset = ((start + i) % self.slots) * self.SLOT.size
+            slot_hash, tokens, last = self.SLOT.unpack_from(self._map, offset)
+            if slot_hash == key_hash:
+                return offset, tokens, last
+            if slot_hash == 0:
+                return offset, float(policy.burst), now
+            if last < victim_last:
+                victim, victim_last = offset, last
+        return victim, float(policy.burst), now
 
 class RateLimiter:
-    def __init__(self):
-        self._requests: Dict[str, Tuple[int, float]] = {}
-
-    async def check_rate_limit(self, request: Request):
-        key = f"{request.client.host}:{request.url.path}"
-        current_time = time.time()
-
-        if key in self._requests:
-            count, window_start = self._requests[key]
-            if current_time - window_start < 60:  # 1分間のウィンドウ
-                if count >= 100:  # 1分間に100リクエストまで
-                    raise HTTPException(
-                        status_code=429,
-                        detail="Too many requests"
-                    )
-                self._requests[key] = (count + 1, window_start)
-            else:
-                self._requests[key] = (1, current_time)
+    """リクエスト元とルートからポリシーを選び、バケットからトークンを消費する（GatewayMiddlewareから呼ばれる）"""
+
+    def __init__(
+        self,
+        default_policy: RateLimitPolicy,
+        route_policies: Dict[str, RateLimitPolicy],
+        key_policies: Dict[str, RateLimitPolicy],
+        exempt_paths: Tuple[str, ...] = (),
+        max_keys: int = 100000,
+        shared_path: Optional[str] = None
+    ):
+        self.default_policy = default_policy
+        self.route_policies = route_policies
+        # APIキーはハッシュ化して保持する
+        self.key_policies = {self._key_id(key): policy for key, policy in key_policies.items()}
+        self.exempt_paths = frozenset(exempt_paths)
+        policies = [default_policy, *route_policies.values(), *key_policies.values()]
+        if shared_path:
+            self.store = SharedBucketStore(shared_path, max_keys)
         else:
-            self._requests[key] = (1, current_time)
+            self.store = BucketStore(max_keys, idle_ttl=max(p.refill_time for p in policies))
+        self.stats = {"allowed": 0, "limited": 0}
+
+    @staticmethod
+    def _key_id(api_key: str) -> str:
+        return hashlib.blake2b(api_key.encode(), digest_size=12).hexdigest()
+
+    def check(self, path: str, client_ip: Optional[str], headers: Headers) -> Optional[Tuple[int, str, Dict[str, str]]]:
+        """制限する場合は (ステータスコード, 詳細, レスポンスヘッダー) を返す"""
+        if path in self.exempt_paths:
+            return None
+
+        # 登録済みのAPIキーはキー単位で制限する（未登録のキーを使い回して制限を逃れないようIPで数える）
+        policy, bucket = None, None
+        api_key = headers.get(settings.API_KEY_HEADER) if self.key_policies else None
+        if api_key:
+            key_id = self._key_id(api_key)
+            policy = self.key_policies.get(key_id)
+            bucket = f"key:{key_id}"
+        if policy is None:
+            bucket = f"ip:{client_ip}"
+            policy = self.route_policies.get(path)
+            bucket += f"|{path}" if policy is not None else "|*"
+            policy = policy or self.default_policy
+
+        allowed, _, retry_after = self.store.take(bucket, policy, time.monotonic())
+        if allowed:
+            self.stats["allowed"] += 1
+            return None
+        self.stats["limited"] += 1
+        logger.warning(f"Rate limit exceeded: {bucket}", extra={"path": path, "client_ip": client_ip})
+        return 429, "Too many requests", {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = dict(self.stats)
+        if isinstance(self.store, BucketStore):
+            stats["buckets"] = len(self.store)
+        return stats
+
+rate_limiter = RateLimiter(
+    default_policy=RateLimitPolicy.from_config(settings.RATE_LIMIT_DEFAULT),
+    route_policies={
+        path: RateLimitPolicy.from_config(config)
+        for path, config in settings.RATE_LIMIT_ROUTES.items()
+    },
+    key_policies={
+        key: RateLimitPolicy.from_config(config)
+        for key, config in settings.RATE_LIMIT_API_KEYS.items()
+    },
+    exempt_paths=tuple(settings.RATE_LIMIT_EXEMPT_PATHS),
+    max_keys=settings.RATE_LIMIT_MAX_KEYS,
+    shared_path=settings.RATE_LIMIT_SHARED_PATH
+)
@@ -1,3 +1,4 @@
+from cachetools import TTLCache
 from fastapi import Request, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from config import get_settings, get_logger
@@ -12,7 +13,8 @@ settings = get_settings()
 class SecurityHandler:
     def __init__(self):
         self.bearer = HTTPBearer()
-        self._token_cache = {}  # {token: (expiry_time, rate_limit_info)}
+        # {token: (expiry_time, rate_limit_info)}。1時間で期限切れになり、件数も上限を設ける
+        self._token_cache: TTLCache = TTLCache(maxsize=10000, ttl=3600)
 
     async def validate_admin_token(self, request: Request) -> bool:
         try:
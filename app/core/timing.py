@@ -0,0 +1,68 @@
+"""リクエスト単位の処理時間の内訳（Server-Timingヘッダー用）
+
+GatewayMiddlewareがリクエストごとにRequestTimingを作成してcontextvarに設定し、
+ルート・ContextEnhancer・RFClientはstage()/count()で記録する。
+コンテキスト外（バッチ処理やベンチマーク）では何もしない。
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, Optional
+import time
+
+class RequestTiming:
+    __slots__ = ("stages", "counts")
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}  # ステージ名 -> 秒（同名は合算）
+        self.counts: Dict[str, int] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def incr(self, name: str, n: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def header_value(self, total: float) -> str:
+        # ステージは入れ子になりうる（enrich は extract と rf を含む）ため、
+        # other は最上位ステージ（enrich, claude）以外の時間とする
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        other = total - self.stages.get("enrich", 0.0) - self.stages.get("claude", 0.0)
+        parts.append(f"other;dur={max(other, 0.0) * 1000:.1f}")
+        parts.append(f"total;dur={total * 1000:.1f}")
+        if self.counts:
+            desc = " ".join(f"{name}={n}" for name, n in self.counts.items())
+            parts.append(f'cache;desc="{desc}"')
+        return ", ".join(parts)
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+def start_request() -> Token:
+    return _current.set(RequestTiming())
+
+def end_request(token: Token):
+    _current.reset(token)
+
+def current() -> Optional[RequestTiming]:
+    return _current.get()
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+def record(name: str, seconds: float):
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+def count(name: str, n: int = 1):
+    timing = _current.get()
+    if timing is not None and n:
+        timing.incr(name, n)
@@ -32,6 +32,10 @@ class Message(BaseModel):
             return self.content
         return self.content.text
 
+    def get_text(self) -> str:
+        """メッセージのテキスト内容を取得（サービス層向け）"""
+        return self.text_content
+
     model_config = {
         "json_schema_extra": {
             "examples": [
@@ -50,6 +54,7 @@ class MCPRequest(BaseModel):
     max_tokens: Optional[int] = Field(None, ge=0, le=4096, description="生成する最大トークン数（0-4096）")
     temperature: Optional[float] = Field(None, ge=0.0, le=1.0, description="生成時の温度（0.0-1.0）")
     system: Optional[str] = Field(None, description="システムプロンプト")
+    stream: bool = Field(default=False, description="SSEでストリーミング応答を返すか")
     metadata: Optional[Dict[str, Any]] = Field(default=None, description="追加のメタデータ")
 
     @computed_field
@@ -75,6 +80,8 @@ class Usage(BaseModel):
     """トークン使用量モデル（Anthropic Claude形式）"""
     input_tokens: int = Field(..., ge=0, description="入力トークン数")
     output_tokens: int = Field(..., ge=0, description="出力トークン数")
+    cache_creation_input_tokens: int = Field(0, ge=0, description="プロンプトキャッシュに書き込んだ入力トークン数")
+    cache_read_input_tokens: int = Field(0, ge=0, description="プロンプトキャッシュから読み込んだ入力トークン数")
 
     @computed_field
     def total_tokens(self) -> int:
@@ -1,11 +1,37 @@
 from cachetools import TTLCache
-from typing import Optional, Dict, Any
+from typing import List, NamedTuple, Optional, Dict, Any, Tuple, Union
 from config import get_logger, get_settings
+from .shared_cache import SharedCacheStore
+from contextlib import contextmanager
+import asyncio
+import fcntl
+import gzip
+import heapq
+import json
+import os
+import threading
+import time
 
 logger = get_logger()
 settings = get_settings()
 
+class CacheEntry(NamedTuple):
+    value: Optional[Dict[str, Any]]  # Noneはネガティブエントリ（RFに存在しないIOC）
+    expires_at: float  # UNIX時刻（ワーカー間で共通の期限）
+
+    @property
+    def negative(self) -> bool:
+        return self.value is None
+
+# スナップショットの1行: (cache_type, key, expires_at, value)
+# valueは未エンコードのdict（ネガティブはNone）か、復元後に未参照のままのJSON文字列
+SnapshotRow = Tuple[str, str, float, Union[Dict[str, Any], str, None]]
+
+SNAPSHOT_VERSION = 1
+
 class RFCache:
+    CACHE_TYPES = ("ip", "domain", "vulnerability", "hash")
+
     def __init__(self):
         self.ip_cache = TTLCache(
             maxsize=settings.CACHE_MAX_SIZE,
@@ -15,25 +41,232 @@ class RFCache:
         self.vulnerability_cache = TTLCache(maxsize=1000, ttl=1800)  # 30分
         self.hash_cache = TTLCache(maxsize=1000, ttl=300)
 
+        # ワーカー間共有層（有効時はワーカー内キャッシュがL1になる）
+        self.shared: Optional[SharedCacheStore] = None
+        if settings.SHARED_CACHE_PATH:
+            self.shared = SharedCacheStore(
+                settings.SHARED_CACHE_PATH,
+                max_entries=settings.SHARED_CACHE_MAX_ENTRIES
+            )
+
+        # 前回のスナップショットはワーカーのlifespanで読み込む
+        self.snapshot_path: Optional[str] = settings.CACHE_SNAPSHOT_PATH
+        self._snapshot: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self._snapshot_expires_at = 0.0
+        # fcntl.lockf はプロセス単位のため、同じワーカー内のスレッド同士はこちらで直列化する
+        self._snapshot_thread_lock = threading.Lock()
+
     def get(self, cache_type: str, key: str) -> Optional[Dict[str, Any]]:
-        try:
-            cache = getattr(self, f"{cache_type}_cache")
-            return cache.get(key)
-        except AttributeError:
-            logger.error(f"Invalid cache type: {cache_type}")
+        entry = self.get_entry(cache_type, key)
+        return entry.value if entry is not None else None
+
+    def get_entry(self, cache_type: str, key: str) -> Optional[CacheEntry]:
+        """キャッシュの有無を判定する（ネガティブエントリも返す）"""
+        cache = self._get_cache(cache_type)
+        if cache is None:
             return None
 
+        now = time.time()
+        entry = cache.get(key)
+        if entry is not None and entry.expires_at > now:
+            return entry
+
+        if self._snapshot:
+            entry = self._take_from_snapshot(cache_type, key, now)
+            if entry is not None:
+                cache[key] = entry
+                return entry
+
+        if self.shared is not None:
+            found = self.shared.get(cache_type, key)
+            if found is not None:
+                # 共有層の期限をそのまま引き継ぐ
+                entry = CacheEntry(*found)
+                cache[key] = entry
+                return entry
+        return None
+
+    def is_stale(self, cache_type: str, entry: CacheEntry) -> bool:
+        """ソフトTTLを過ぎた（裏で再取得すべき）エントリか判定する"""
+        soft_ttl = settings.CACHE_SOFT_TTLS.get(cache_type)
+        if not soft_ttl or entry.negative:
+            return False
+        # 期限は常に「保存時刻 + ハードTTL」なので、ソフト期限は逆算できる
+        cache = getattr(self, f"{cache_type}_cache")
+        return time.time() >= entry.expires_at - cache.ttl + soft_ttl
+
     def set(self, cache_type: str, key: str, value: Dict[str, Any]):
+        cache = self._get_cache(cache_type)
+        if cache is None:
+            return
+        self._store(cache_type, cache, key, CacheEntry(value, time.time() + cache.ttl))
+        logger.debug(f"Cached {cache_type} data for key: {key}")
+
+    def set_negative(self, cache_type: str, key: str):
+        """RFに存在しないIOCを短いTTLで記録する"""
+        cache = self._get_cache(cache_type)
+        if cache is None:
+            return
+        ttl = min(settings.CACHE_NEGATIVE_TTLS.get(cache_type, 60), cache.ttl)
+        self._store(cache_type, cache, key, CacheEntry(None, time.time() + ttl))
+        logger.debug(f"Cached negative {cache_type} entry for key: {key}")
+
+    def _get_cache(self, cache_type: str) -> Optional[TTLCache]:
         try:
-            cache = getattr(self, f"{cache_type}_cache")
-            cache[key] = value
-            logger.debug(f"Cached {cache_type} data for key: {key}")
+            return getattr(self, f"{cache_type}_cache")
         except AttributeError:
             logger.error(f"Invalid cache type: {cache_type}")
+            return None
+
+    def _store(self, cache_type: str, cache: TTLCache, key: str, entry: CacheEntry):
+        cache[key] = entry
+        if self.shared is not None:
+            self.shared.set(cache_type, key, entry.value, entry.expires_at)
 
     def clear_all(self):
         self.ip_cache.clear()
         self.domain_cache.clear()
         self.vulnerability_cache.clear()
         self.hash_cache.clear()
+        self._snapshot = {}
+        if self.shared is not None:
+            self.shared.clear()
+        # ファイルを残すと次の保存でマージされ、再起動後に消したエントリが復元される
+        self.remove_snapshot()
         logger.info("All caches cleared")
+
+    def snapshot_entries(self) -> List[SnapshotRow]:
+        now = time.time()
+        rows: List[SnapshotRow] = []
+        for cache_type in self.CACHE_TYPES:
+            cache = getattr(self, f"{cache_type}_cache")
+            for key, entry in list(cache.items()):
+                if entry.expires_at > now:
+                    rows.append((cache_type, key, entry.expires_at, entry.value))
+        # 未参照のまま残っている復元エントリも引き継ぐ
+        for (cache_type, key), (expires_at, value) in self._snapshot.items():
+            if expires_at > now:
+                rows.append((cache_type, key, expires_at, value))
+
+        max_entries = settings.CACHE_SNAPSHOT_MAX_ENTRIES
+        if len(rows) > max_entries:
+            rows = heapq.nlargest(max_entries, rows, key=lambda row: row[2])
+        return rows
+
+    def write_snapshot(self, rows: List[SnapshotRow]):
+        """スナップショットを保存する（各ワーカーが同じファイルに書くため、既存の内容とマージする）"""
+        if not self.snapshot_path:
+            return
+        # 書き込み途中のファイルを他のワーカーに読ませないよう差し替えで保存する
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            # 読み込みから差し替えまでをワーカー間で直列化する
+            with self._snapshot_lock():
+                entries = self._merge_snapshot(rows, self._read_snapshot() or [])
+                payload = {"version": SNAPSHOT_VERSION, "saved_at": time.time(), "entries": entries}
+                with gzip.open(tmp_path, "wb", compresslevel=1) as f:
+                    f.write(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+                os.replace(tmp_path, self.snapshot_path)
+            logger.info(f"Cache snapshot saved: {len(entries)} entries ({len(rows)} from this worker)")
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Cache snapshot save failed: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def remove_snapshot(self):
+        if not self.snapshot_path:
+            return
+        try:
+            with self._snapshot_lock():
+                os.remove(self.snapshot_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Cache snapshot remove failed: {str(e)}")
+
+    @contextmanager
+    def _snapshot_lock(self):
+        with self._snapshot_thread_lock, open(f"{self.snapshot_path}.lock", "a") as lock:
+            fcntl.lockf(lock, fcntl.LOCK_EX)
+            yield
+
+    @staticmethod
+    def _merge_snapshot(rows: List[SnapshotRow], existing: List[SnapshotRow]) -> List[SnapshotRow]:
+        # 同じキーは期限の遅い方を残す。値はJSON文字列として格納し、復元時のデコードを参照時まで遅らせる
+        now = time.time()
+        merged: Dict[Tuple[str, str], Tuple[float, Any]] = {
+            (cache_type, key): (expires_at, value)
+            for cache_type, key, expires_at, value in existing
+            if expires_at > now
+        }
+        for cache_type, key, expires_at, value in rows:
+            current = merged.get((cache_type, key))
+            if current is None or current[0] <= expires_at:
+                merged[(cache_type, key)] = (expires_at, value)
+        entries = [
+            (cache_type, key, expires_at, value if isinstance(value, str) else json.dumps(value, separators=(",", ":")))
+            for (cache_type, key), (expires_at, value) in merged.items()
+        ]
+        max_entries = settings.CACHE_SNAPSHOT_MAX_ENTRIES
+        if len(entries) > max_entries:
+            entries = heapq.nlargest(max_entries, entries, key=lambda row: row[2])
+        return entries
+
+    def _read_snapshot(self) -> Optional[List[SnapshotRow]]:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with gzip.open(self.snapshot_path, "rb") as f:
+                payload = json.loads(f.read())
+        except (OSError, EOFError, ValueError) as e:
+            logger.warning(f"Cache snapshot read failed: {str(e)}")
+            return None
+        if payload.get("version") != SNAPSHOT_VERSION:
+            logger.warning(f"Ignoring cache snapshot with version {payload.get('version')}")
+            return None
+        return payload.get("entries", [])
+
+    def save_snapshot(self):
+        self.write_snapshot(self.snapshot_entries())
+
+    async def run_snapshot_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            # エントリの収集はイベントループ上で、圧縮とI/Oはスレッドで行う
+            rows = self.snapshot_entries()
+            await asyncio.to_thread(self.write_snapshot, rows)
+
+    def restore_snapshot(self):
+        """前回のスナップショットを読み込む（lifespanでスレッドから呼ぶ）"""
+        start = time.perf_counter()
+        entries = self._read_snapshot()
+        if entries is None:
+            return
+
+        # L1へは参照時に移す（TTLCacheへの一括投入は件数に比例して遅いため）
+        now = time.time()
+        self._snapshot = {
+            (cache_type, key): (expires_at, value)
+            for cache_type, key, expires_at, value in entries
+            if expires_at > now
+        }
+        self._snapshot_expires_at = max((e for e, _ in self._snapshot.values()), default=0.0)
+        logger.info(
+            f"Cache snapshot loaded: {len(self._snapshot)} entries "
+            f"in {time.perf_counter() - start:.3f}s"
+        )
+
+    def _take_from_snapshot(self, cache_type: str, key: str, now: float) -> Optional[CacheEntry]:
+        if now >= self._snapshot_expires_at:
+            # 全エントリが期限切れになったら索引ごと解放する
+            self._snapshot = {}
+            return None
+        found = self._snapshot.pop((cache_type, key), None)
+        if found is None or found[0] <= now:
+            return None
+        try:
+            return CacheEntry(json.loads(found[1]), found[0])
+        except ValueError:
+            return None
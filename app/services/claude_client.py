@@ -1,55 +1,140 @@
 import httpx
-from typing import List, Dict, Optional
+import json
+import time
+from typing import AsyncIterator, Callable, List, Dict, Optional
 from config import get_settings, get_logger
 from app.core.exceptions import ClaudeAPIException
+from app.core.metrics import CLAUDE_IN_PROGRESS, observe_claude_response, record_tokens
 from app.models.messages import Message, MCPResponse, Usage
+from .http_pool import create_client, pool_stats
+from .resilience import AdaptiveLimiter
 
 settings = get_settings()
 logger = get_logger()
 
+# 上流の過負荷を示すステータスコード（529: overloaded）
+OVERLOAD_STATUSES = {"429", "500", "502", "503", "504", "529"}
+# プロンプトキャッシュのブレークポイント
+CACHE_CONTROL = {"type": "ephemeral"}
+# 使用量としてレスポンスから取り出すフィールド
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
 class ClaudeClient:
     def __init__(self):
         self.base_url = settings.CLAUDE_API_BASE_URL
         self.api_key = settings.CLAUDE_API_KEY
-        self.client = httpx.AsyncClient(
-            base_url=self.base_url,
-            headers={
-                "x-api-key": self.api_key,
-                "anthropic-version": "2024-01-01"
-            },
-            timeout=60.0
+        # httpxクライアントはワーカーのlifespanで start() / aclose() する
+        self.client: Optional[httpx.AsyncClient] = None
+        # 上流の混雑に合わせて同時リクエスト数を調整し、溢れた分は503で即座に返す
+        self.limiter = AdaptiveLimiter(
+            "Claude API",
+            initial_limit=settings.CLAUDE_CONCURRENCY_INITIAL,
+            min_limit=settings.CLAUDE_CONCURRENCY_MIN,
+            max_limit=settings.CLAUDE_CONCURRENCY_MAX,
+            max_queue=settings.CLAUDE_QUEUE_SIZE,
+            queue_timeout=settings.CLAUDE_QUEUE_TIMEOUT,
+            latency_target=settings.CLAUDE_LATENCY_TARGET
         )
 
+    def start(self):
+        if self.client is None:
+            self.client = create_client(
+                base_url=self.base_url,
+                headers={
+                    "x-api-key": self.api_key,
+                    "anthropic-version": "2023-06-01"
+                },
+                timeout=60.0,
+                max_connections=settings.CLAUDE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.CLAUDE_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.CLAUDE_KEEPALIVE_EXPIRY,
+                http2=settings.CLAUDE_HTTP2
+            )
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def pool_stats(self) -> Dict[str, int]:
+        return pool_stats(self.client, settings.CLAUDE_MAX_CONNECTIONS)
+
+    @staticmethod
+    def _is_overloaded(status: str) -> bool:
+        # "error" はタイムアウトや接続エラー
+        return status == "error" or status in OVERLOAD_STATUSES
+
+    def _build_payload(
+        self,
+        messages: List[Message],
+        model: str,
+        max_tokens: Optional[int],
+        temperature: Optional[float],
+        system: Optional[str] = None
+    ) -> Dict:
+        """リクエスト本体を組み立てる
+
+        ContextEnhancerが挿入した role="system" のRFコンテキストは会話から外し、
+        システムプロンプトの後ろに会話の順で並べてトップレベルの system に入れる。
+        既存のブロックは次のターンでも同じ内容・順序になるため、システムプロンプトの末尾、
+        RFコンテキストの末尾、最後のメッセージにブレークポイントを置けば
+        前のターンまでのプレフィックスが上流でキャッシュから読まれる。
+        """
+        system_blocks = [{"type": "text", "text": system}] if system else []
+        conversation = []
+        for msg in messages:
+            if msg.role == "system":
+                system_blocks.append({"type": "text", "text": msg.get_text()})
+            else:
+                conversation.append({"role": msg.role, "content": msg.get_text()})
+
+        if settings.CLAUDE_PROMPT_CACHE:
+            # ブレークポイントは最大4つまで（ここでは3つ以内）
+            if system and len(system_blocks) > 1:
+                system_blocks[0]["cache_control"] = CACHE_CONTROL
+            if system_blocks:
+                system_blocks[-1]["cache_control"] = CACHE_CONTROL
+            if conversation:
+                last = conversation[-1]
+                last["content"] = [{"type": "text", "text": last["content"], "cache_control": CACHE_CONTROL}]
+
+        payload = {
+            "messages": conversation,
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        if system_blocks:
+            payload["system"] = system_blocks
+        return payload
+
     async def create_message(
         self,
         messages: List[Message],
         model: str,
         max_tokens: Optional[int] = None,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        system: Optional[str] = None
     ) -> MCPResponse:
+        await self.limiter.acquire()
+        status = "error"
+        start = time.perf_counter()
+        CLAUDE_IN_PROGRESS.inc()
         try:
             response = await self.client.post(
                 "/messages",
-                json={
-                    "messages": [
-                        {"role": msg.role, "content": msg.get_text()}
-                        for msg in messages
-                    ],
-                    "model": model,
-                    "max_tokens": max_tokens,
-                    "temperature": temperature
-                }
+                json=self._build_payload(messages, model, max_tokens, temperature, system)
             )
+            status = str(response.status_code)
             response.raise_for_status()
             data = response.json()
 
+            usage = Usage(**{field: data["usage"].get(field) or 0 for field in USAGE_FIELDS})
+            record_tokens(model, usage)
             return MCPResponse(
                 content=data["content"][0]["text"],
                 model=model,
-                usage=Usage(
-                    input_tokens=data["usage"]["input_tokens"],
-                    output_tokens=data["usage"]["output_tokens"]
-                )
+                usage=usage
             )
         except httpx.HTTPStatusError as e:
             logger.error(f"Claude API error: {str(e)}")
@@ -57,3 +142,101 @@ class ClaudeClient:
         except Exception as e:
             logger.error(f"Unexpected error in Claude API request: {str(e)}")
             raise ClaudeAPIException(str(e))
+        finally:
+            elapsed = time.perf_counter() - start
+            self.limiter.release(elapsed, overloaded=self._is_overloaded(status))
+            CLAUDE_IN_PROGRESS.dec()
+            observe_claude_response("unary", status, elapsed)
+
+    async def stream_message(
+        self,
+        messages: List[Message],
+        model: str,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        system: Optional[str] = None,
+        on_complete: Optional[Callable[[Usage], None]] = None
+    ) -> AsyncIterator[bytes]:
+        """ストリーミングを開始し、SSEをそのまま中継するイテレータを返す
+
+        上流のエラーはレスポンス送信前にここで例外として送出される。
+        """
+        payload = self._build_payload(messages, model, max_tokens, temperature, system)
+        payload["stream"] = True
+        request = self.client.build_request("POST", "/messages", json=payload)
+        await self.limiter.acquire()
+        start = time.perf_counter()
+        CLAUDE_IN_PROGRESS.inc()
+        try:
+            response = await self.client.send(request, stream=True)
+        except BaseException as e:
+            elapsed = time.perf_counter() - start
+            self.limiter.release(elapsed, overloaded=isinstance(e, Exception))
+            CLAUDE_IN_PROGRESS.dec()
+            observe_claude_response("stream", "error", elapsed)
+            if not isinstance(e, Exception):
+                raise
+            logger.error(f"Unexpected error in Claude API request: {str(e)}")
+            raise ClaudeAPIException(str(e))
+
+        # 過負荷の判定にはヘッダー受信までの時間を使う（生成時間は出力の長さに依存するため）
+        first_byte = time.perf_counter() - start
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            status = str(response.status_code)
+            self.limiter.release(first_byte, overloaded=self._is_overloaded(status))
+            CLAUDE_IN_PROGRESS.dec()
+            observe_claude_response("stream", status, time.perf_counter() - start)
+            logger.error(f"Claude API error: {response.status_code} {response.text}")
+            raise ClaudeAPIException(response.text, status_code=response.status_code)
+
+        events = self._relay_events(response, model, start, first_byte, on_complete)
+        # 開始済みのジェネレーターは送信前に切断されて破棄されても finally が実行され、
+        # 接続と同時実行数の枠が確実に返される
+        await events.__anext__()
+        return events
+
+    async def _relay_events(
+        self,
+        response: httpx.Response,
+        model: str,
+        start: float,
+        first_byte: float,
+        on_complete: Optional[Callable[[Usage], None]]
+    ) -> AsyncIterator[bytes]:
+        usage = dict.fromkeys(USAGE_FIELDS, 0)
+        buffer = b""
+        try:
+            yield b""
+            async for chunk in response.aiter_bytes():
+                # 受信したチャンクはパースを待たずに即座に転送する
+                yield chunk
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if line.startswith(b"data:") and b'"usage"' in line:
+                        self._collect_usage(line[5:], usage)
+        finally:
+            await response.aclose()
+            # ストリームが終わるまで枠を保持する
+            self.limiter.release(first_byte)
+            CLAUDE_IN_PROGRESS.dec()
+            observe_claude_response("stream", str(response.status_code), time.perf_counter() - start)
+
+        usage = Usage(**usage)
+        record_tokens(model, usage)
+        if on_complete is not None:
+            on_complete(usage)
+
+    @staticmethod
+    def _collect_usage(data: bytes, usage: Dict[str, int]):
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
+        # message_start に入力トークン（キャッシュの読み書き分を含む）、message_delta に累計の出力トークンが入る
+        event_usage = event.get("message", {}).get("usage") or event.get("usage") or {}
+        for field in USAGE_FIELDS:
+            if event_usage.get(field):
+                usage[field] = event_usage[field]
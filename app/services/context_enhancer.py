@@ -1,52 +1,139 @@
-from typing import List, Dict
+from cachetools import TTLCache
+from dataclasses import dataclass
+from typing import List, Dict, NamedTuple, Optional, Tuple
 from app.models.messages import Message
 from app.core.exceptions import ValidationError
+from app.core import timing
+from app.core.metrics import IOC_EXTRACTION_LATENCY
+from config import get_logger, get_settings
 from .rf_client import RFClient
-import re
+from .ioc_extractor import IOCExtractor
+from .context_formatter import ContextFormatter
+from .skip_index import SkipIndex
+import hashlib
+import time
+
+logger = get_logger()
+settings = get_settings()
+
+class EnrichmentMemo(NamedTuple):
+    iocs: List[Tuple[str, str]]
+    block: Optional[str]  # 整形済みのコンテキスト（IOCが無い・取得できなければNone）
+    complete: bool  # 全IOCの結果が揃っていればブロックをそのまま再利用できる
+    enriched: int  # RFのデータが得られたIOC数
+
+@dataclass
+class EnrichmentReport:
+    """1リクエスト分のエンリッチメント結果の集計"""
+    enriched: int = 0  # RFのデータをコンテキストに含めたIOC
+    unknown: int = 0  # RFに存在しなかったIOC
+    skipped: int = 0  # 期限切れ・失敗でコンテキストに含められなかったIOC
+
+    def header_value(self) -> str:
+        return f"enriched={self.enriched}; unknown={self.unknown}; skipped={self.skipped}"
 
 class ContextEnhancer:
     def __init__(self, rf_client: RFClient):
         self.rf_client = rf_client
-        self.ip_pattern = re.compile(r'\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b')
-        self.domain_pattern = re.compile(r'\b(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9][a-z0-9-]{0,61}[a-z0-9]\b')
-        self.cve_pattern = re.compile(r'CVE-\d{4}-\d{4,7}', re.IGNORECASE)
+        self.extractor = IOCExtractor(
+            ambiguous_tlds=settings.DOMAIN_AMBIGUOUS_TLDS,
+            ambiguous_min_labels=settings.DOMAIN_AMBIGUOUS_MIN_LABELS
+        )
+        # プライベートIPや自社ドメインなど、RFに問い合わせる意味のないIOC
+        self.skip_index = SkipIndex(
+            include_reserved=settings.SKIP_RESERVED_RANGES,
+            path=settings.SKIP_LIST_PATH,
+            reload_interval=settings.SKIP_LIST_RELOAD_INTERVAL
+        )
+        self.formatter = ContextFormatter(
+            token_budget=settings.ENRICH_CONTEXT_TOKEN_BUDGET,
+            detail_min_risk=settings.ENRICH_CONTEXT_DETAIL_MIN_RISK
+        )
+        # メッセージ本文のハッシュ -> 抽出・整形結果（会話の過去ターンを再処理しない）
+        self._memo: TTLCache = TTLCache(
+            maxsize=settings.ENRICH_MEMO_MAX_SIZE,
+            ttl=settings.ENRICH_MEMO_TTL
+        )
+        self.stats = {"memo_hits": 0, "memo_misses": 0}
+
+    async def enhance_messages(
+        self,
+        messages: List[Message],
+        deadline: Optional[float] = None,
+        report: Optional[EnrichmentReport] = None
+    ) -> List[Message]:
+        """deadline（秒）までに揃ったRF情報だけでメッセージを強化する"""
+        report = report if report is not None else EnrichmentReport()
+        self.skip_index.maybe_reload()
+        blocks: Dict[int, Optional[str]] = {}
+        pending: Dict[int, Tuple[bytes, List[Tuple[str, str]]]] = {}
+        for i, message in enumerate(messages):
+            if message.role != "user":
+                continue
+            text = message.get_text()
+            key = self._memo_key(text)
+            memo = self._memo.get(key)
+            if memo is not None and memo.complete:
+                self.stats["memo_hits"] += 1
+                timing.count("memo_hit")
+                blocks[i] = memo.block
+                report.enriched += memo.enriched
+                report.unknown += len(memo.iocs) - memo.enriched
+                continue
+            self.stats["memo_misses"] += 1
+            if memo is not None:
+                iocs = memo.iocs
+            else:
+                start = time.perf_counter()
+                # 除外するIOCはキャッシュ・RFの参照前に落とす
+                iocs = self.skip_index.filter(self.extractor.extract(text))
+                elapsed = time.perf_counter() - start
+                IOC_EXTRACTION_LATENCY.observe(elapsed)
+                timing.record("extract", elapsed)
+            pending[i] = (key, iocs)
+
+        # 新しい（または未完了の）ターンのIOCだけを1回のバルクルックアップで取得する
+        all_iocs = [ioc for _, iocs in pending.values() for ioc in iocs]
+        results = {}
+        if all_iocs:
+            with timing.stage("rf"):
+                results = await self.rf_client.lookup_many(all_iocs, deadline=deadline)
+
+        for i, (key, iocs) in pending.items():
+            context = {
+                f"{ioc_type}_{value}": results[(ioc_type, value)]
+                for ioc_type, value in iocs
+                if results.get((ioc_type, value)) is not None
+            }
+            block = self._format_context(context) if context else None
+            # RFに存在しないIOC（None）は確定済みとして扱う
+            resolved = sum(1 for ioc in iocs if ioc in results)
+            complete = resolved == len(iocs)
+            self._memo[key] = EnrichmentMemo(iocs, block if complete else None, complete, len(context))
+            blocks[i] = block
+            report.enriched += len(context)
+            report.unknown += resolved - len(context)
+            report.skipped += len(iocs) - resolved
 
-    async def enhance_messages(self, messages: List[Message]) -> List[Message]:
         enhanced_messages = []
-        for message in messages:
-            if message.role == "user":
-                context = await self._get_rf_context(message.get_text())
-                if context:
-                    enhanced_messages.append(Message(
-                        role="system",
-                        content=self._format_context(context)
-                    ))
+        for i, message in enumerate(messages):
+            block = blocks.get(i)
+            if block:
+                enhanced_messages.append(Message(role="system", content=block))
             enhanced_messages.append(message)
         return enhanced_messages
 
-    async def _get_rf_context(self, text: str) -> Dict:
-        context = {}
-        ips = self.ip_pattern.findall(text)
-        domains = self.domain_pattern.findall(text)
-        cves = self.cve_pattern.findall(text)
-
-        for ip in ips:
-            try:
-                info = await self.rf_client.get_ip_info(ip)
-                context[f"ip_{ip}"] = info
-            except Exception as e:
-                continue
+    def clear_memo(self):
+        # 整形済みのブロックは取得時のRF情報を含むため、RFキャッシュと一緒に捨てる
+        self._memo.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "memo_size": len(self._memo), "skip_index": self.skip_index.get_stats()}
 
-        # Similar for domains and CVEs
-        return context
+    @staticmethod
+    def _memo_key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
 
     def _format_context(self, context: Dict) -> str:
         # Format the context information for Claude
-        formatted = ["Recorded Future Intelligence:"]
-        for key, value in context.items():
-            formatted.append(f"\n{key}:")
-            if "risk" in value:
-                formatted.append(f"Risk Score: {value['risk'].get('score', 'N/A')}")
-            if "timestamps" in value:
-                formatted.append(f"First Seen: {value['timestamps'].get('firstSeen', 'N/A')}")
-        return "\n".join(formatted)
+        return self.formatter.format(context)
@@ -0,0 +1,79 @@
+"""RFコンテキストの整形（トークン予算付き）
+
+IOCをリスクスコアの高い順に並べ、高リスクのものは項目ごとに、低リスクのものは
+1行1件の表にまとめる。予算（おおよそのトークン数）に収まらない末尾は省き、その件数を注記する。
+"""
+from typing import Dict, List, Optional, Tuple
+
+HEADER = "Recorded Future Intelligence:"
+TABLE_HEADER = "indicator | risk | first seen"
+# 英数字・記号が中心のテキストは1トークンあたり約4文字
+CHARS_PER_TOKEN = 4
+# 省略の注記のために予算から確保しておく文字数
+NOTE_RESERVE = 100
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def _risk_score(value: Dict) -> Optional[int]:
+    score = (value.get("risk") or {}).get("score")
+    return score if isinstance(score, (int, float)) else None
+
+class ContextFormatter:
+    def __init__(self, token_budget: int = 0, detail_min_risk: int = 0):
+        # token_budget: 0以下で無制限 / detail_min_risk: これ未満のスコアは表にまとめる
+        self.token_budget = token_budget
+        self.detail_min_risk = detail_min_risk
+
+    def format(self, context: Dict[str, Dict]) -> str:
+        ranked: List[Tuple[str, Dict, Optional[int]]] = sorted(
+            ((key, value, _risk_score(value)) for key, value in context.items()),
+            key=lambda item: -1 if item[2] is None else item[2],
+            reverse=True
+        )
+        limit = self.token_budget * CHARS_PER_TOKEN - NOTE_RESERVE if self.token_budget > 0 else None
+        used = len(HEADER)
+        details: List[str] = []
+        rows: List[str] = []
+        omitted = 0
+        for key, value, score in ranked:
+            if omitted:
+                omitted += 1
+                continue
+            if score is None or score >= self.detail_min_risk:
+                section = self._section(key, value)
+                if limit is None or used + len(section) + 1 <= limit:
+                    details.append(section)
+                    used += len(section) + 1
+                    continue
+            # 低リスク、または項目ごとでは予算に収まらないものは表の1行にする
+            row = self._row(key, value, score)
+            cost = len(row) + 1 + (0 if rows else len(TABLE_HEADER) + 2)
+            if limit is None or used + cost <= limit:
+                rows.append(row)
+                used += cost
+            else:
+                omitted = 1
+
+        formatted = [HEADER, *details]
+        if rows:
+            formatted.append(f"\n{TABLE_HEADER}")
+            formatted.extend(rows)
+        if omitted:
+            formatted.append(f"\n({omitted} lower-risk indicators omitted to fit the context budget)")
+        return "\n".join(formatted)
+
+    @staticmethod
+    def _section(key: str, value: Dict) -> str:
+        lines = [f"\n{key}:"]
+        if "risk" in value:
+            lines.append(f"Risk Score: {value['risk'].get('score', 'N/A')}")
+        if "timestamps" in value:
+            lines.append(f"First Seen: {value['timestamps'].get('firstSeen', 'N/A')}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _row(key: str, value: Dict, score: Optional[int]) -> str:
+        first_seen = (value.get("timestamps") or {}).get("firstSeen") or "-"
+        # 表では日付のみ
+        return f"{key} | {'-' if score is None else score} | {first_seen[:10]}"
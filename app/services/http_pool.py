@@ -0,0 +1,40 @@
+"""上流API用のhttpxクライアント生成と接続プールの統計"""
+import httpx
+from typing import Dict, Optional
+
+def create_client(
+    base_url: str,
+    headers: Dict[str, str],
+    timeout: float,
+    max_connections: int,
+    max_keepalive_connections: int,
+    keepalive_expiry: float,
+    http2: bool = False
+) -> httpx.AsyncClient:
+    # 接続を使い回してTCP/TLSハンドシェイクを繰り返さないよう、keepaliveを上限近くまで保持する
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        ),
+        http2=http2
+    )
+
+def pool_stats(client: Optional[httpx.AsyncClient], max_connections: int) -> Dict[str, int]:
+    """接続プールの使用状況（queued > 0 ならプールが飽和している）"""
+    # httpcoreの接続プールを参照する（ASGITransportなど接続プールを持たない場合は0）
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    requests = list(getattr(pool, "_requests", []))
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "max_connections": max_connections,
+        "connections": len(connections),
+        "active": len(connections) - idle,
+        "idle": idle,
+        "queued": sum(1 for request in requests if request.is_queued())
+    }
@@ -2,10 +2,20 @@ from .cache import RFCache
 from .rf_client import RFClient
 from .claude_client import ClaudeClient
 from .context_enhancer import ContextEnhancer
+from .context_formatter import ContextFormatter
+from .ioc_extractor import IOCExtractor
+from .response_cache import ResponseCache
+from .skip_index import SkipIndex
+from .public_suffix import PublicSuffixList
 
 __all__ = [
     'RFCache',
     'RFClient',
     'ClaudeClient',
-    'ContextEnhancer'
+    'ContextEnhancer',
+    'ContextFormatter',
+    'IOCExtractor',
+    'ResponseCache',
+    'SkipIndex',
+    'PublicSuffixList'
 ]
@@ -0,0 +1,93 @@
+from typing import Iterable, List, Optional, Tuple
+import ipaddress
+import re
+from .public_suffix import normalize_hostname, public_suffix_list
+
+# 漢字・かな・ハングル。ラベルの途中で文字種が変わるところをドメインの境界とし、
+# 「通信先evil.comへの」から evil.com を取り出す（日本語.jp のようにラベル全体がCJKなら1ラベルとして扱う）
+_CJK = r"\u3005\u3007\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f\uac00-\ud7af"
+_ALNUM = rf"[^\W_{_CJK}]"  # CJK以外の英数字
+_INNER = rf"(?:[^\W{_CJK}]|-)"  # CJK以外でラベルの途中に使える文字
+_HAN = rf"[{_CJK}]"
+_DOMAIN = rf"""
+    (?<![.-])(?:(?<![^\W{_CJK}])(?={_ALNUM})|(?<!{_HAN})(?={_HAN}))
+    (?:(?:{_ALNUM}(?:{_INNER}{{0,61}}{_ALNUM})?|{_HAN}{{1,63}})\.)+
+    (?:[^\W\d_{_CJK}]{_INNER}{{0,61}}{_ALNUM}(?!{_INNER})|{_HAN}{{2,63}}(?!{_HAN}|-))
+    (?!\.[^\W_])
+"""
+
+# 1回の走査で全種別を拾う。同じ位置では先に書いた候補が優先される
+# CVE・ハッシュ・IPの境界判定はASCIIのみ（(?a:...)）。\b や \w のままだと「脆弱性CVE-2024-3094の」のように
+# 日本語に直接続くIOCを取りこぼす
+# ドメインは国際化ドメイン名も拾い、公開サフィックスリストで検証する
+_IOC_PATTERN = re.compile(
+    r"""
+    (?P<vulnerability>(?a:\bCVE-\d{4}-\d{4,7}\b))
+    | (?P<hash>(?a:\b(?:[0-9a-f]{64}|[0-9a-f]{40}|[0-9a-f]{32})\b))
+    | (?P<ipv4>(?a:(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?!\d|\.\d)))
+    | (?P<ipv6>(?a:(?<![\w:.])(?:[0-9a-f]{0,4}:){2,7}(?:(?:\d{1,3}\.){3}\d{1,3}|[0-9a-f]{0,4})(?![\w:]|\.\d)))
+    | (?P<domain>""" + _DOMAIN + r""")
+    """,
+    re.IGNORECASE | re.VERBOSE
+)
+
+class IOCExtractor:
+    """テキストからIOCを抽出し、検証・重複排除して出現順に返す"""
+
+    def __init__(self, ambiguous_tlds: Iterable[str] = (), ambiguous_min_labels: int = 0):
+        # ファイルの拡張子と紛らわしいTLDは、ラベル数が ambiguous_min_labels 以上の場合だけドメインとする
+        self.ambiguous_tlds = frozenset(tld.lower() for tld in ambiguous_tlds)
+        self.ambiguous_min_labels = ambiguous_min_labels
+
+    def extract(self, text: str) -> List[Tuple[str, str]]:
+        seen = set()
+        iocs: List[Tuple[str, str]] = []
+        for match in _IOC_PATTERN.finditer(text):
+            ioc = self._classify(match.lastgroup, match.group())
+            if ioc is not None and ioc not in seen:
+                seen.add(ioc)
+                iocs.append(ioc)
+        return iocs
+
+    def _classify(self, kind: str, value: str) -> Optional[Tuple[str, str]]:
+        if kind == "ipv4":
+            try:
+                ipaddress.IPv4Address(value)
+            except ValueError:
+                # 999.1.1.1 のような不正なオクテット
+                return None
+            return ("ip", value)
+        if kind == "ipv6":
+            # a::b や dead::beef のようなコード片を除外するため数字を含むものに限る
+            if not any(c.isdigit() for c in value):
+                return None
+            try:
+                address = ipaddress.IPv6Address(value)
+            except ValueError:
+                # 12:30:45 のような時刻などは除外される
+                return None
+            if address.is_unspecified:
+                return None
+            # ::ffff:1.2.3.4 はIPv4アドレスとして扱う
+            if address.ipv4_mapped is not None:
+                return ("ip", str(address.ipv4_mapped))
+            return ("ip", address.compressed)
+        if kind == "vulnerability":
+            return ("vulnerability", value.upper())
+        if kind == "hash":
+            return ("hash", value.lower())
+        if len(value) > 253:
+            return None
+        hostname = normalize_hostname(value)
+        if hostname is None or "_" in hostname or not self._is_registrable(hostname):
+            return None
+        return ("domain", hostname)
+
+    def _is_registrable(self, hostname: str) -> bool:
+        # logging.handlers → 未知のTLD / co.uk → 公開サフィックスそのもの / config.py → 紛らわしいTLDでラベル不足
+        labels = hostname.count(".") + 1
+        suffix = public_suffix_list.suffix_length(hostname)
+        if suffix == 0 or labels <= suffix:
+            return False
+        tld = hostname[hostname.rfind(".") + 1:]
+        return tld not in self.ambiguous_tlds or labels >= self.ambiguous_min_labels
@@ -0,0 +1,64 @@
+"""公開サフィックスリストによるドメインの検証と正規化
+
+埋め込みのルール（public_suffix_data.py）をTLDから順にたどるトライにしておき、
+ホスト名の公開サフィックスと登録可能ドメイン（サフィックス＋1ラベル）を求める。
+未知のTLD（logging.handlers など）や公開サフィックスそのもの（co.uk など）はドメインとして扱わない。
+"""
+from typing import Dict, Iterable, Optional
+import idna
+from .public_suffix_data import RULES
+
+_RULE = ""  # このノードまでが公開サフィックス
+_EXCEPTION = "!"  # 例外ルール（このラベルは公開サフィックスに含めない）
+_WILDCARD = "*"
+
+def normalize_hostname(hostname: str) -> Optional[str]:
+    """小文字・末尾のドット無し・IDNAのA-label（xn--）にそろえる。不正なホスト名はNone"""
+    hostname = hostname.rstrip(".")
+    if hostname.isascii():
+        return hostname.lower() or None
+    try:
+        return idna.encode(hostname, uts46=True).decode("ascii")
+    except idna.IDNAError:
+        return None
+
+class PublicSuffixList:
+    def __init__(self, rules: Iterable[str]):
+        # 1行 = "TLD 第2レベルのルール..."（tools/build_public_suffix.py の出力形式）
+        self._root: Dict[str, Dict] = {}
+        for line in rules:
+            tld, *children = line.split()
+            node = self._root.setdefault(tld, {})
+            node[_RULE] = True
+            for child in children:
+                if child.startswith(_EXCEPTION):
+                    node.setdefault(child[1:], {})[_EXCEPTION] = True
+                else:
+                    node.setdefault(child, {})[_RULE] = True
+
+    def suffix_length(self, hostname: str) -> int:
+        """公開サフィックスのラベル数。未知のTLDなら0"""
+        node = self._root
+        length = 0
+        for depth, label in enumerate(reversed(hostname.split(".")), 1):
+            child = node.get(label)
+            if child is None:
+                if _WILDCARD in node:
+                    length = depth
+                break
+            if _EXCEPTION in child:
+                break
+            if _RULE in child:
+                length = depth
+            node = child
+        return length
+
+    def registrable_domain(self, hostname: str) -> Optional[str]:
+        """登録可能ドメイン（例: www.example.co.uk -> example.co.uk）。無ければNone"""
+        labels = hostname.split(".")
+        length = self.suffix_length(hostname)
+        if length == 0 or len(labels) <= length:
+            return None
+        return ".".join(labels[-length - 1:])
+
+public_suffix_list = PublicSuffixList(RULES.splitlines())
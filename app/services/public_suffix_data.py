@@ -0,0 +1,1498 @@
+"""公開サフィックスリストの埋め込みデータ（tools/build_public_suffix.py で生成。手で編集しない）
+
+https://publicsuffix.org/ のICANNセクションから2ラベルまでのルールを抜き出したもの（MPL 2.0）。
+1行が1つのTLDで、続く語はその下の公開サフィックス（* はワイルドカード、! は例外）。
+"""
+
+RULES = """\
+aaa
+aarp
+abarth
+abb
+abbott
+abbvie
+abc
+able
+abogado
+abudhabi
+ac com edu gov mil net org
+academy
+accenture
+accountant
+accountants
+aco
+actor
+ad nom
+ads
+adult
+ae ac co gov mil net org sch
+aeg
+aero accident-investigation accident-prevention aerobatic aeroclub aerodrome agents air-surveillance air-traffic-control aircraft airline airport airtraffic ambulance amusement association author ballooning broker caa cargo catering certification championship charter civilaviation club conference consultant consulting control council crew design dgca educator emergency engine engineer entertainment equipment exchange express federation flight fuel gliding government groundhandling group hanggliding homebuilt insurance journal journalist leasing logistics magazine maintenance media microlight modelling navigation parachuting paragliding passenger-association pilot press production recreation repbody res research rotorcraft safety scientist services show skydiving software student trader trading trainer union workinggroup works
+aetna
+af com edu gov net org
+afl
+africa
+ag co com net nom org
+agakhan
+agency
+ai com net off org
+aig
+airbus
+airforce
+airtel
+akdn
+al com edu gov mil net org
+alfaromeo
+alibaba
+alipay
+allfinanz
+allstate
+ally
+alsace
+alstom
+am co com commune net org
+amazon
+americanexpress
+americanfamily
+amex
+amfam
+amica
+amsterdam
+analytics
+android
+anquan
+anz
+ao co ed gv it og pb
+aol
+apartments
+app
+apple
+aq
+aquarelle
+ar bet com coop edu gob gov int mil musica mutual net org senasa tur
+arab
+aramco
+archi
+army
+arpa e164 in-addr ip6 iris uri urn
+art
+arte
+as gov
+asda
+asia
+associates
+at ac co gv or
+athleta
+attorney
+au act asn com conf edu gov id info net nsw nt org oz qld sa tas vic wa
+auction
+audi
+audible
+audio
+auspost
+author
+auto
+autos
+avianca
+aw com
+aws
+ax
+axa
+az biz com edu gov info int mil name net org pp pro
+azure
+ba com edu gov mil net org
+baby
+baidu
+banamex
+bananarepublic
+band
+bank
+bar
+barcelona
+barclaycard
+barclays
+barefoot
+bargains
+baseball
+basketball
+bauhaus
+bayern
+bb biz co com edu gov info net org store tv
+bbc
+bbt
+bbva
+bcg
+bcn
+bd *
+be ac
+beats
+beauty
+beer
+bentley
+berlin
+best
+bestbuy
+bet
+bf gov
+bg 0 1 2 3 4 5 6 7 8 9 a b c d e f g h i j k l m n o p q r s t u v w x y z
+bh com edu gov net org
+bharti
+bi co com edu or org
+bible
+bid
+bike
+bing
+bingo
+bio
+biz
+bj africa agro architectes assur avocats co com eco econo edu info loisirs money net org ote restaurant resto tourism univ
+black
+blackfriday
+blockbuster
+blog
+bloomberg
+blue
+bm com edu gov net org
+bms
+bmw
+bn com edu gov net org
+bnpparibas
+bo academia agro arte blog bolivia ciencia com cooperativa democracia deporte ecologia economia edu empresa gob indigena industria info int medicina mil movimiento musica natural net nombre noticias org patria plurinacional politica profesional pueblo revista salud tecnologia tksat transporte tv web wiki
+boats
+boehringer
+bofa
+bom
+bond
+boo
+book
+booking
+bosch
+bostik
+boston
+bot
+boutique
+box
+br 9guacu abc adm adv agr aju am anani aparecida app arq art ato b barueri belem bhz bib bio blog bmd boavista bsb campinagrande campinas caxias cim cng cnt com contagem coop coz cri cuiaba curitiba def des det dev ecn eco edu emp enf eng esp etc eti far feira flog floripa fm fnd fortal fot foz fst g12 geo ggf goiania gov gru imb ind inf jab jampa jdf joinville jor jus leg lel log londrina macapa maceio manaus maringa mat med mil morena mp mus natal net niteroi not ntr odo ong org osasco palmas poa ppg pro psc psi pvh qsl radio rec recife rep ribeirao rio riobranco riopreto salvador sampa santamaria santoandre saobernardo saogonca seg sjc slg slz sorocaba srv taxi tc tec teo the tmp trd tur tv udi vet vix vlog wiki zlg
+bradesco
+bridgestone
+broadway
+broker
+brother
+brussels
+bs com edu gov net org
+bt com edu gov net org
+build
+builders
+business
+buy
+buzz
+bv
+bw co org
+by com gov mil of
+bz com edu gov net org
+bzh
+ca ab bc gc mb nb nf nl ns nt nu on pe qc sk yk
+cab
+cafe
+cal
+call
+calvinklein
+cam
+camera
+camp
+canon
+capetown
+capital
+capitalone
+car
+caravan
+cards
+care
+career
+careers
+cars
+casa
+case
+cash
+casino
+cat
+catering
+catholic
+cba
+cbn
+cbre
+cbs
+cc
+cd gov
+center
+ceo
+cern
+cf
+cfa
+cfd
+cg
+ch
+chanel
+channel
+charity
+chase
+chat
+cheap
+chintai
+christmas
+chrome
+church
+ci ac asso co com ed edu go gouv int md net or org presse xn--aroport-bya
+cipriani
+circle
+cisco
+citadel
+citi
+citic
+city
+cityeats
+ck !www *
+cl co gob gov mil
+claims
+cleaning
+click
+clinic
+clinique
+clothing
+cloud
+club
+clubmed
+cm co com gov net
+cn ac ah bj com cq edu fj gd gov gs gx gz ha hb he hi hk hl hn jl js jx ln mil mo net nm nx org qh sc sd sh sn sx tj tw xj xn--55qx5d xn--io0a7i xn--od0alg xz yn zj
+co arts com edu firm gov info int mil net nom org rec web
+coach
+codes
+coffee
+college
+cologne
+com
+comcast
+commbank
+community
+company
+compare
+computer
+comsec
+condos
+construction
+consulting
+contact
+contractors
+cooking
+cookingchannel
+cool
+coop
+corsica
+country
+coupon
+coupons
+courses
+cpa
+cr ac co ed fi go or sa
+credit
+creditcard
+creditunion
+cricket
+crown
+crs
+cruise
+cruises
+cu com edu gov inf net org
+cuisinella
+cv com edu int nome org
+cw com edu net org
+cx gov
+cy ac biz com ekloges gov ltd mil net org press pro tm
+cymru
+cyou
+cz
+dabur
+dad
+dance
+data
+date
+dating
+datsun
+day
+dclk
+dds
+de
+deal
+dealer
+deals
+degree
+delivery
+dell
+deloitte
+delta
+democrat
+dental
+dentist
+desi
+design
+dev
+dhl
+diamonds
+diet
+digital
+direct
+directory
+discount
+discover
+dish
+diy
+dj
+dk
+dm com edu gov net org
+dnp
+do art com edu gob gov mil net org sld web
+docs
+doctor
+dog
+domains
+dot
+download
+drive
+dtv
+dubai
+dunlop
+dupont
+durban
+dvag
+dvr
+dz art asso com edu gov net org pol soc tm
+earth
+eat
+ec com edu fin gob gov info k12 med mil net org pro
+eco
+edeka
+edu
+education
+ee aip com edu fie gov lib med org pri riik
+eg com edu eun gov mil name net org sci
+email
+emerck
+energy
+engineer
+engineering
+enterprises
+epson
+equipment
+er *
+ericsson
+erni
+es com edu gob nom org
+esq
+estate
+et biz com edu gov info name net org
+etisalat
+eu
+eurovision
+eus
+events
+exchange
+expert
+exposed
+express
+extraspace
+fage
+fail
+fairwinds
+faith
+family
+fan
+fans
+farm
+farmers
+fashion
+fast
+fedex
+feedback
+ferrari
+ferrero
+fi aland
+fiat
+fidelity
+fido
+film
+final
+finance
+financial
+fire
+firestone
+firmdale
+fish
+fishing
+fit
+fitness
+fj ac biz com gov info mil name net org pro
+fk *
+flickr
+flights
+flir
+florist
+flowers
+fly
+fm com edu net org
+fo
+foo
+food
+foodnetwork
+football
+ford
+forex
+forsale
+forum
+foundation
+fox
+fr aeroport asso avocat avoues cci chambagri chirurgiens-dentistes com experts-comptables geometre-expert gouv greta huissier-justice medecin nom notaires pharmacien port prd tm veterinaire
+free
+fresenius
+frl
+frogans
+frontdoor
+frontier
+ftr
+fujitsu
+fun
+fund
+furniture
+futbol
+fyi
+ga
+gal
+gallery
+gallo
+gallup
+game
+games
+gap
+garden
+gay
+gb
+gbiz
+gd edu gov
+gdn
+ge com edu gov mil net org pvt
+gea
+gent
+genting
+george
+gf
+gg co net org
+ggee
+gh com edu gov mil org
+gi com edu gov ltd mod org
+gift
+gifts
+gives
+giving
+gl co com edu net org
+glass
+gle
+global
+globo
+gm
+gmail
+gmbh
+gmo
+gmx
+gn ac com edu gov net org
+godaddy
+gold
+goldpoint
+golf
+goo
+goodyear
+goog
+google
+gop
+got
+gov
+gp asso com edu mobi net org
+gq
+gr com edu gov net org
+grainger
+graphics
+gratis
+green
+gripe
+grocery
+group
+gs
+gt com edu gob ind mil net org
+gu com edu gov guam info net org web
+guardian
+gucci
+guge
+guide
+guitars
+guru
+gw
+gy co com edu gov net org
+hair
+hamburg
+hangout
+haus
+hbo
+hdfc
+hdfcbank
+health
+healthcare
+help
+helsinki
+here
+hermes
+hgtv
+hiphop
+hisamitsu
+hitachi
+hiv
+hk com edu gov idv net org xn--55qx5d xn--ciqpn xn--gmq050i xn--gmqw5a xn--io0a7i xn--lcvr32d xn--mk0axi xn--mxtq1m xn--od0alg xn--od0aq3b xn--tn0ag xn--uc0atv xn--uc0ay4a xn--wcvs22d xn--zf0avx
+hkt
+hm
+hn com edu gob mil net org
+hockey
+holdings
+holiday
+homedepot
+homegoods
+homes
+homesense
+honda
+horse
+hospital
+host
+hosting
+hot
+hoteles
+hotels
+hotmail
+house
+how
+hr com from iz name
+hsbc
+ht adult art asso com coop edu firm gouv info med net org perso pol pro rel shop
+hu 2000 agrar bolt casino city co erotica erotika film forum games hotel info ingatlan jogasz konyvelo lakas media news org priv reklam sex shop sport suli szex tm tozsde utazas video
+hughes
+hyatt
+hyundai
+ibm
+icbc
+ice
+icu
+id ac biz co desa go mil my net or ponpes sch web
+ie gov
+ieee
+ifm
+ikano
+il ac co gov idf k12 muni net org
+im ac co com net org tt tv
+imamat
+imdb
+immo
+immobilien
+in 5g 6g ac ai am bihar biz business ca cn co com coop cs delhi dr edu er firm gen gov gujarat ind info int internet io me mil net nic org pg post pro res travel tv uk up us
+inc
+industries
+infiniti
+info
+ing
+ink
+institute
+insurance
+insure
+int eu
+international
+intuit
+investments
+io com
+ipiranga
+iq com edu gov mil net org
+ir ac co gov id net org sch xn--mgba3a4f16a xn--mgba3a4fra
+irish
+is com edu gov int net org
+ismaili
+ist
+istanbul
+it abr abruzzo ag agrigento al alessandria alto-adige altoadige an ancona andria-barletta-trani andria-trani-barletta andriabarlettatrani andriatranibarletta ao aosta aosta-valley aostavalley aoste ap aq aquila ar arezzo ascoli-piceno ascolipiceno asti at av avellino ba balsan balsan-sudtirol balsan-suedtirol bari barletta-trani-andria barlettatraniandria bas basilicata belluno benevento bergamo bg bi biella bl bn bo bologna bolzano bolzano-altoadige bozen bozen-sudtirol bozen-suedtirol br brescia brindisi bs bt bulsan bulsan-sudtirol bulsan-suedtirol bz ca cagliari cal calabria caltanissetta cam campania campidano-medio campidanomedio campobasso carbonia-iglesias carboniaiglesias carrara-massa carraramassa caserta catania catanzaro cb ce cesena-forli cesenaforli ch chieti ci cl cn co como cosenza cr cremona crotone cs ct cuneo cz dell-ogliastra dellogliastra edu emilia-romagna emiliaromagna emr en enna fc fe fermo ferrara fg fi firenze florence fm foggia forli-cesena forlicesena fr friuli-v-giulia friuli-ve-giulia friuli-vegiulia friuli-venezia-giulia friuli-veneziagiulia friuli-vgiulia friuliv-giulia friulive-giulia friulivegiulia friulivenezia-giulia friuliveneziagiulia friulivgiulia frosinone fvg ge genoa genova go gorizia gov gr grosseto iglesias-carbonia iglesiascarbonia im imperia is isernia kr la-spezia laquila laspezia latina laz lazio lc le lecce lecco li lig liguria livorno lo lodi lom lombardia lombardy lt lu lucania lucca macerata mantova mar marche massa-carrara massacarrara matera mb mc me medio-campidano mediocampidano messina mi milan milano mn mo modena mol molise monza monza-brianza monza-e-della-brianza monzabrianza monzaebrianza monzaedellabrianza ms mt na naples napoli no novara nu nuoro og ogliastra olbia-tempio olbiatempio or oristano ot pa padova padua palermo parma pavia pc pd pe perugia pesaro-urbino pesarourbino pescara pg pi piacenza piedmont piemonte pisa pistoia pmn pn po pordenone potenza pr prato pt pu pug puglia pv pz ra ragusa ravenna rc re reggio-calabria reggio-emilia reggiocalabria reggioemilia rg ri rieti rimini rm rn ro roma rome rovigo sa salerno sar sardegna sardinia sassari savona si sic sicilia sicily siena siracusa so sondrio sp sr ss suedtirol sv ta taa taranto te tempio-olbia tempioolbia teramo terni tn to torino tos toscana tp tr trani-andria-barletta trani-barletta-andria traniandriabarletta tranibarlettaandria trapani trentin-sud-tirol trentin-sudtirol trentin-sued-tirol trentin-suedtirol trentino trentino-a-adige trentino-aadige trentino-alto-adige trentino-altoadige trentino-s-tirol trentino-stirol trentino-sud-tirol trentino-sudtirol trentino-sued-tirol trentino-suedtirol trentinoa-adige trentinoaadige trentinoalto-adige trentinoaltoadige trentinos-tirol trentinostirol trentinosud-tirol trentinosudtirol trentinosued-tirol trentinosuedtirol trentinsud-tirol trentinsudtirol trentinsued-tirol trentinsuedtirol trento treviso trieste ts turin tuscany tv ud udine umb umbria urbino-pesaro urbinopesaro va val-d-aosta val-daosta vald-aosta valdaosta valle-aosta valle-d-aosta valle-daosta valleaosta valled-aosta valledaosta vallee-aoste vallee-d-aoste valleeaoste valleedaoste vao varese vb vc vda ve ven veneto venezia venice verbania vercelli verona vi vibo-valentia vibovalentia vicenza viterbo vr vs vt vv xn--balsan-sdtirol-nsb xn--bozen-sdtirol-2ob xn--bulsan-sdtirol-nsb xn--cesena-forl-mcb xn--cesenaforl-i8a xn--forl-cesena-fcb xn--forlcesena-c8a xn--sdtirol-n2a xn--trentin-sd-tirol-rzb xn--trentin-sdtirol-7vb xn--trentino-sd-tirol-c3b xn--trentino-sdtirol-szb xn--trentinosd-tirol-rzb xn--trentinosdtirol-7vb xn--trentinsd-tirol-6vb xn--trentinsdtirol-nsb xn--valle-aoste-ebb xn--valle-d-aoste-ehb xn--valleaoste-e7a xn--valledaoste-ebb
+itau
+itv
+jaguar
+java
+jcb
+je co net org
+jeep
+jetzt
+jewelry
+jio
+jll
+jm *
+jmp
+jnj
+jo com edu gov mil name net org sch
+jobs
+joburg
+jot
+joy
+jp ac ad aichi akita aomori chiba co ed ehime fukui fukuoka fukushima gifu go gr gunma hiroshima hokkaido hyogo ibaraki ishikawa iwate kagawa kagoshima kanagawa kochi kumamoto kyoto lg mie miyagi miyazaki nagano nagasaki nara ne niigata oita okayama okinawa or osaka saga saitama shiga shimane shizuoka tochigi tokushima tokyo tottori toyama wakayama xn--0trq7p7nn xn--1ctwo xn--1lqs03n xn--1lqs71d xn--2m4a15e xn--32vp30h xn--4it168d xn--4it797k xn--4pvxs xn--5js045d xn--5rtp49c xn--5rtq34k xn--6btw5a xn--6orx2r xn--7t0a264c xn--8ltr62k xn--8pvr4u xn--c3s14m xn--d5qv7z876c xn--djrs72d6uy xn--djty4k xn--efvn9s xn--ehqz56n xn--elqq16h xn--f6qx53a xn--k7yn95e xn--kbrq7o xn--klt787d xn--kltp7d xn--kltx9a xn--klty5x xn--mkru45i xn--nit225k xn--ntso0iqx3a xn--ntsq17g xn--pssu33l xn--qqqt11m xn--rht27z xn--rht3d xn--rht61e xn--rny31h xn--tor131o xn--uist22h xn--uisz3g xn--uuwu58a xn--vgu402c xn--zbx025d yamagata yamaguchi yamanashi
+jpmorgan
+jprs
+juegos
+juniper
+kaufen
+kddi
+ke ac co go info me mobi ne or sc
+kerryhotels
+kerrylogistics
+kerryproperties
+kfh
+kg com edu gov mil net org
+kh *
+ki biz com edu gov info net org
+kia
+kids
+kim
+kinder
+kindle
+kitchen
+kiwi
+km ass asso com coop edu gouv gov medecin mil nom notaires org pharmaciens prd presse tm veterinaire
+kn edu gov net org
+koeln
+komatsu
+kosher
+kp com edu gov org rep tra
+kpmg
+kpn
+kr ac busan chungbuk chungnam co daegu daejeon es gangwon go gwangju gyeongbuk gyeonggi gyeongnam hs incheon jeju jeonbuk jeonnam kg mil ms ne or pe re sc seoul ulsan
+krd
+kred
+kuokgroup
+kw com edu emb gov ind net org
+ky com edu net org
+kyoto
+kz com edu gov mil net org
+la com edu gov info int net org per
+lacaixa
+lamborghini
+lamer
+lancaster
+lancia
+land
+landrover
+lanxess
+lasalle
+lat
+latino
+latrobe
+law
+lawyer
+lb com edu gov net org
+lc co com edu gov net org
+lds
+lease
+leclerc
+lefrak
+legal
+lego
+lexus
+lgbt
+li
+lidl
+life
+lifeinsurance
+lifestyle
+lighting
+like
+lilly
+limited
+limo
+lincoln
+linde
+link
+lipsy
+live
+living
+lk ac assn com edu gov grp hotel int ltd net ngo org sch soc web
+llc
+llp
+loan
+loans
+locker
+locus
+lol
+london
+lotte
+lotto
+love
+lpl
+lplfinancial
+lr com edu gov net org
+ls ac biz co edu gov info net org sc
+lt gov
+ltd
+ltda
+lu
+lundbeck
+luxe
+luxury
+lv asn com conf edu gov id mil net org
+ly com edu gov id med net org plc sch
+ma ac co gov net org press
+macys
+madrid
+maif
+maison
+makeup
+man
+management
+mango
+map
+market
+marketing
+markets
+marriott
+marshalls
+maserati
+mattel
+mba
+mc asso tm
+mckinsey
+md
+me ac co edu gov its net org priv
+med
+media
+meet
+melbourne
+meme
+memorial
+men
+menu
+merckmsd
+mg co com edu gov mil nom org prd tm
+mh
+miami
+microsoft
+mil
+mini
+mint
+mit
+mitsubishi
+mk com edu gov inf name net org
+ml com edu gouv gov net org presse
+mlb
+mls
+mm *
+mma
+mn edu gov org
+mo com edu gov net org
+mobi
+mobile
+moda
+moe
+moi
+mom
+monash
+money
+monster
+mormon
+mortgage
+moscow
+moto
+motorcycles
+mov
+movie
+mp
+mq
+mr gov
+ms com edu gov net org
+msd
+mt com edu net org
+mtn
+mtr
+mu ac co com gov net or org
+museum academy agriculture air airguard alabama alaska amber ambulance american americana americanantiques americanart amsterdam and annefrank anthro anthropology antiques aquarium arboretum archaeological archaeology architecture art artanddesign artcenter artdeco arteducation artgallery arts artsandcrafts asmatart assassination assisi association astronomy atlanta austin australia automotive aviation axis badajoz baghdad bahn bale baltimore barcelona baseball basel baths bauern beauxarts beeldengeluid bellevue bergbau berkeley berlin bern bible bilbao bill birdart birthplace bonn boston botanical botanicalgarden botanicgarden botany brandywinevalley brasil bristol british britishcolumbia broadcast brunel brussel brussels bruxelles building burghof bus bushey cadaques california cambridge can canada capebreton carrier cartoonart casadelamoneda castle castres celtic center chattanooga cheltenham chesapeakebay chicago children childrens childrensgarden chiropractic chocolate christiansburg cincinnati cinema circus civilisation civilization civilwar clinton clock coal coastaldefence cody coldwar collection colonialwilliamsburg coloradoplateau columbia columbus communication communications community computer computerhistory contemporary contemporaryart convent copenhagen corporation corvette costume countryestate county crafts cranbrook creation cultural culturalcenter culture cyber cymru dali dallas database ddr decorativearts delaware delmenhorst denmark depot design detroit dinosaur discovery dolls donostia durham eastafrica eastcoast education educational egyptian eisenbahn elburg elvendrell embroidery encyclopedic england entomology environment environmentalconservation epilepsy essex estate ethnology exeter exhibition family farm farmequipment farmers farmstead field figueres filatelia film fineart finearts finland flanders florida force fortmissoula fortworth foundation francaise frankfurt franziskaner freemasonry freiburg fribourg frog fundacio furniture gallery garden gateway geelvinck gemological geology georgia giessen glas glass gorge grandrapids graz guernsey halloffame hamburg handson harvestcelebration hawaii health heimatunduhren hellas helsinki hembygdsforbund heritage histoire historical historicalsociety historichouses historisch historisches history historyofscience horology house humanities illustration imageandsound indian indiana indianapolis indianmarket intelligence interactive iraq iron isleofman jamison jefferson jerusalem jewelry jewish jewishart jfk journalism judaica judygarland juedisches juif karate karikatur kids koebenhavn koeln kunst kunstsammlung kunstunddesign labor labour lajolla lancashire landes lans larsson lewismiller lincoln linz living livinghistory localhistory london losangeles louvre loyalist lucerne luxembourg luzern mad madrid mallorca manchester mansion mansions manx marburg maritime maritimo maryland marylhurst media medical medizinhistorisches meeres memorial mesaverde michigan midatlantic military mill miners mining minnesota missile missoula modern moma money monmouth monticello montreal moscow motorcycle muenchen muenster mulhouse muncie museet museumcenter museumvereniging music national nationalfirearms nationalheritage nativeamerican naturalhistory naturalhistorymuseum naturalsciences nature naturhistorisches natuurwetenschappen naumburg naval nebraska neues newhampshire newjersey newmexico newport newspaper newyork niepce norfolk north nrw nyc nyny oceanographic oceanographique omaha online ontario openair oregon oregontrail otago oxford pacific paderborn palace paleo palmsprings panama paris pasadena pharmacy philadelphia philadelphiaarea philately phoenix photography pilots pittsburgh planetarium plantation plants plaza portal portland portlligat posts-and-telecommunications preservation presidio press project public pubol quebec railroad railway research resistance riodejaneiro rochester rockart roma russia saintlouis salem salvadordali salzburg sandiego sanfrancisco santabarbara santacruz santafe saskatchewan satx savannahga schlesisches schoenbrunn schokoladen school schweiz science science-fiction scienceandhistory scienceandindustry sciencecenter sciencecenters sciencehistory sciences sciencesnaturelles scotland seaport settlement settlers shell sherbrooke sibenik silk ski skole society sologne soundandvision southcarolina southwest space spy square stadt stalbans starnberg state stateofdelaware station steam steiermark stjohn stockholm stpetersburg stuttgart suisse surgeonshall surrey svizzera sweden sydney tank tcm technology telekommunikation television texas textile theater time timekeeping topology torino touch town transport tree trolley trust trustee uhren ulm undersea university usa usantiques usarts uscountryestate usculture usdecorativearts usgarden ushistory ushuaia uslivinghistory utah uvic valley vantaa versailles viking village virginia virtual virtuel vlaanderen volkenkunde wales wallonie war washingtondc watch-and-clock watchandclock western westfalen whaling wildlife williamsburg windmill workshop xn--9dbhblg6di xn--comunicaes-v6a2o xn--correios-e-telecomunicaes-ghc29a xn--h1aegh xn--lns-qla york yorkshire yosemite youth zoological zoology
+music
+mutual
+mv aero biz com coop edu gov info int mil museum name net org pro
+mw ac biz co com coop edu gov int museum net org
+mx com edu gob net org
+my biz com edu gov mil name net org
+mz ac adv co edu gov mil net org
+na ca cc co com dr in info mobi mx name or org pro school tv us ws
+nab
+nagoya
+name
+natura
+navy
+nba
+nc asso nom
+ne
+nec
+net
+netbank
+netflix
+network
+neustar
+new
+news
+next
+nextdirect
+nexus
+nf arts com firm info net other per rec store web
+nfl
+ng com edu gov i mil mobi name net org sch
+ngo
+nhk
+ni ac biz co com edu gob in info int mil net nom org web
+nico
+nike
+nikon
+ninja
+nissan
+nissay
+nl
+no aa aarborte aejrie afjord agdenes ah aknoluokta akrehamn al alaheadju alesund algard alstahaug alta alvdal amli amot andasuolo andebu andoy ardal aremark arendal arna aseral asker askim askoy askvoll asnes audnedaln aukra aure aurland aurskog-holand austevoll austrheim averoy badaddja bahcavuotna bahccavuotna baidar bajddar balat balestrand ballangen balsfjord bamble bardu barum batsfjord bearalvahki beardu beiarn berg bergen berlevag bievat bindal birkenes bjarkoy bjerkreim bjugn bodo bokn bomlo bremanger bronnoy bronnoysund brumunddal bryne bu budejju bygland bykle cahcesuolo davvenjarga davvesiida deatnu dep dielddanuorri divtasvuodna divttasvuotna donna dovre drammen drangedal drobak dyroy egersund eid eidfjord eidsberg eidskog eidsvoll eigersund elverum enebakk engerdal etne etnedal evenassi evenes evje-og-hornnes farsund fauske fedje fet fetsund fhs finnoy fitjar fjaler fjell fla flakstad flatanger flekkefjord flesberg flora floro fm folkebibl folldal forde forsand fosnes frana fredrikstad frei frogn froland frosta froya fuoisku fuossko fusa fylkesbibl fyresdal gaivuotna galsa gamvik gangaviika gaular gausdal giehtavuoatna gildeskal giske gjemnes gjerdrum gjerstad gjesdal gjovik gloppen gol gran grane granvin gratangen grimstad grong grue gulen guovdageaidnu ha habmer hadsel hagebostad halden halsa hamar hamaroy hammarfeasta hammerfest hapmir haram hareid harstad hasvik hattfjelldal haugesund hemne hemnes hemsedal herad hitra hjartdal hjelmeland hl hm hobol hof hokksund hol hole holmestrand holtalen honefoss hornindal horten hoyanger hoylandet hurdal hurum hvaler hyllestad ibestad idrett inderoy iveland ivgu jan-mayen jessheim jevnaker jolster jondal jorpeland kafjord karasjohka karasjok karlsoy karmoy kautokeino kirkenes klabu klepp kommune kongsberg kongsvinger kopervik kraanghke kragero kristiansand kristiansund krodsherad krokstadelva kvafjord kvalsund kvam kvanangen kvinesdal kvinnherad kviteseid kvitsoy laakesvuemie lahppi langevag lardal larvik lavagis lavangen leangaviika lebesby leikanger leirfjord leirvik leka leksvik lenvik lerdal lesja levanger lier lierne lillehammer lillesand lindas lindesnes loabat lodingen lom loppa lorenskog loten lund lunner luroy luster lyngdal lyngen malatvuopmi malselv malvik mandal marker marnardal masfjorden masoy matta-varjjat meland meldal melhus meloy meraker midsund midtre-gauldal mil mjondalen mo-i-rana moareke modalen modum molde mosjoen moskenes moss mosvik mr muosat museum naamesjevuemie namdalseid namsos namsskogan nannestad naroy narviika narvik naustdal navuotna nedre-eiker nesna nesodden nesoddtangen nesseby nesset nissedal nittedal nl nord-aurdal nord-fron nord-odal norddal nordkapp nordre-land nordreisa nore-og-uvdal notodden notteroy nt odda of oksnes ol omasvuotna oppdal oppegard orkanger orkdal orland orskog orsta osen oslo osoyro osteroy ostre-toten overhalla ovre-eiker oyer oygarden oystre-slidre porsanger porsangu porsgrunn priv rade radoy rahkkeravju raholt raisa rakkestad ralingen rana randaberg rauma rendalen rennebu rennesoy rindal ringebu ringerike ringsaker risor rissa rl roan rodoy rollag romsa romskog roros rost royken royrvik ruovat rygge salangen salat saltdal samnanger sandefjord sandnes sandnessjoen sandoy sarpsborg sauda sauherad sel selbu selje seljord sf siellak sigdal siljan sirdal skanit skanland skaun skedsmo skedsmokorset ski skien skierva skiptvet skjak skjervoy skodje slattum smola snaase snasa snillfjord snoasa sogndal sogne sokndal sola solund somna sondre-land songdalen sor-aurdal sor-fron sor-odal sor-varanger sorfold sorreisa sortland sorum spjelkavik spydeberg st stange stat stathelle stavanger stavern steigen steinkjer stjordal stjordalshalsen stokke stor-elvdal stord stordal storfjord strand stranda stryn sula suldal sund sunndal surnadal svalbard sveio svelvik sykkylven tana tananger time tingvoll tinn tjeldsund tjome tm tokke tolga tonsberg torsken tr trana tranby tranoy troandin trogstad tromsa tromso trondheim trysil tvedestrand tydal tynset tysfjord tysnes tysvar ullensaker ullensvang ulvik unjarga utsira va vaapste vadso vaga vagan vagsoy vaksdal valle vang vanylven vardo varggat varoy vefsn vega vegarshei vennesla verdal verran vestby vestnes vestre-slidre vestre-toten vestvagoy vevelstad vf vgs vik vikna vindafjord voagat volda voss vossevangen xn--andy-ira xn--asky-ira xn--aurskog-hland-jnb xn--avery-yua xn--bdddj-mrabd xn--bearalvhki-y4a xn--berlevg-jxa xn--bhcavuotna-s4a xn--bhccavuotna-k7a xn--bidr-5nac xn--bievt-0qa xn--bjarky-fya xn--bjddar-pta xn--blt-elab xn--bmlo-gra xn--bod-2na xn--brnny-wuac xn--brnnysund-m8ac xn--brum-voa xn--btsfjord-9za xn--davvenjrga-y4a xn--dnna-gra xn--drbak-wua xn--dyry-ira xn--eveni-0qa01ga xn--finny-yua xn--fjord-lra xn--fl-zia xn--flor-jra xn--frde-gra xn--frna-woa xn--frya-hra xn--ggaviika-8ya47h xn--gildeskl-g0a xn--givuotna-8ya xn--gjvik-wua xn--gls-elac xn--h-2fa xn--hbmer-xqa xn--hcesuolo-7ya35b xn--hgebostad-g3a xn--hmmrfeasta-s4ac xn--hnefoss-q1a xn--hobl-ira xn--holtlen-hxa xn--hpmir-xqa xn--hyanger-q1a xn--hylandet-54a xn--indery-fya xn--jlster-bya xn--jrpeland-54a xn--karmy-yua xn--kfjord-iua xn--klbu-woa xn--koluokta-7ya57h xn--krager-gya xn--kranghke-b0a xn--krdsherad-m8a xn--krehamn-dxa xn--krjohka-hwab49j xn--ksnes-uua xn--kvfjord-nxa xn--kvitsy-fya xn--kvnangen-k0a xn--l-1fa xn--laheadju-7ya xn--langevg-jxa xn--ldingen-q1a xn--leagaviika-52b xn--lesund-hua xn--lgrd-poac xn--lhppi-xqa xn--linds-pra xn--loabt-0qa xn--lrdal-sra xn--lrenskog-54a xn--lt-liac xn--lten-gra xn--lury-ira xn--mely-ira xn--merker-kua xn--mjndalen-64a xn--mlatvuopmi-s4a xn--mli-tla xn--mlselv-iua xn--moreke-jua xn--mosjen-eya xn--mot-tla xn--msy-ula0h xn--mtta-vrjjat-k7af xn--muost-0qa xn--nmesjevuemie-tcba xn--nry-yla5g xn--nttery-byae xn--nvuotna-hwa xn--oppegrd-ixa xn--ostery-fya xn--osyro-wua xn--porsgu-sta26f xn--rady-ira xn--rdal-poa xn--rde-ula xn--rdy-0nab xn--rennesy-v1a xn--rhkkervju-01af xn--rholt-mra xn--risa-5na xn--risr-ira xn--rland-uua xn--rlingen-mxa xn--rmskog-bya xn--rros-gra xn--rskog-uua xn--rst-0na xn--rsta-fra xn--ryken-vua xn--ryrvik-bya xn--s-1fa xn--sandnessjen-ogb xn--sandy-yua xn--seral-lra xn--sgne-gra xn--skierv-uta xn--skjervy-v1a xn--skjk-soa xn--sknit-yqa xn--sknland-fxa xn--slat-5na xn--slt-elab xn--smla-hra xn--smna-gra xn--snase-nra xn--sndre-land-0cb xn--snes-poa xn--snsa-roa xn--sr-aurdal-l8a xn--sr-fron-q1a xn--sr-odal-q1a xn--sr-varanger-ggb xn--srfold-bya xn--srreisa-q1a xn--srum-gra xn--stjrdal-s1a xn--stjrdalshalsen-sqb xn--stre-toten-zcb xn--tjme-hra xn--tnsberg-q1a xn--trany-yua xn--trgstad-r1a xn--trna-woa xn--troms-zua xn--tysvr-vra xn--unjrga-rta xn--vads-jra xn--vard-jra xn--vegrshei-c0a xn--vestvgy-ixa6o xn--vg-yiab xn--vgan-qoa xn--vgsy-qoa0j xn--vre-eiker-k8a xn--vrggt-xqad xn--vry-yla5g xn--yer-zna xn--ygarden-p1a xn--ystre-slidre-ujb
+nokia
+northwesternmutual
+norton
+now
+nowruz
+nowtv
+np *
+nr biz com edu gov info net org
+nra
+nrw
+ntt
+nu
+nyc
+nz ac co cri geek gen govt health iwi kiwi maori mil net org parliament school xn--mori-qsa
+obi
+observer
+office
+okinawa
+olayan
+olayangroup
+oldnavy
+ollo
+om co com edu gov med museum net org pro
+omega
+one
+ong
+onion
+onl
+online
+ooo
+open
+oracle
+orange
+org
+organic
+origins
+osaka
+otsuka
+ott
+ovh
+pa abo ac com edu gob ing med net nom org sld
+page
+panasonic
+paris
+pars
+partners
+parts
+party
+passagens
+pay
+pccw
+pe com edu gob mil net nom org
+pet
+pf com edu org
+pfizer
+pg *
+ph com edu gov i mil net ngo org
+pharmacy
+phd
+philips
+phone
+photo
+photography
+photos
+physio
+pics
+pictet
+pictures
+pid
+pin
+ping
+pink
+pioneer
+pizza
+pk biz com edu fam gob gok gon gop gos gov info net org web
+pl agro aid atm augustow auto babia-gora bedzin beskidy bialowieza bialystok bielawa bieszczady biz boleslawiec bydgoszcz bytom cieszyn com czeladz czest dlugoleka edu elblag elk glogow gmina gniezno gorlice gov grajewo gsm ilawa info jaworzno jelenia-gora jgora kalisz karpacz kartuzy kaszuby katowice kazimierz-dolny kepno ketrzyn klodzko kobierzyce kolobrzeg konin konskowola kutno lapy lebork legnica lezajsk limanowa lomza lowicz lubin lukow mail malbork malopolska mazowsze mazury media miasta mielec mielno mil mragowo naklo net nieruchomosci nom nowaruda nysa olawa olecko olkusz olsztyn opoczno opole org ostroda ostroleka ostrowiec ostrowwlkp pc pila pisz podhale podlasie polkowice pomorskie pomorze powiat priv prochowice pruszkow przeworsk pulawy radom rawa-maz realestate rel rybnik rzeszow sanok sejny sex shop sklep skoczow slask slupsk sos sosnowiec stalowa-wola starachowice stargard suwalki swidnica swiebodzin swinoujscie szczecin szczytno szkola targi tarnobrzeg tgory tm tourism travel turek turystyka tychy ustka walbrzych warmia warszawa waw wegrow wielun wlocl wloclawek wodzislaw wolomin wroclaw zachpomor zagan zarow zgora zgorzelec
+place
+play
+playstation
+plumbing
+plus
+pm
+pn co edu gov net org
+pnc
+pohl
+poker
+politie
+porn
+post
+pr ac biz com edu est gov info isla name net org pro prof
+pramerica
+praxi
+press
+prime
+pro aaa aca acct avocat bar cpa eng jur law med recht
+prod
+productions
+prof
+progressive
+promo
+properties
+property
+protection
+pru
+prudential
+ps com edu gov net org plo sec
+pt com edu gov int net nome org publ
+pub
+pw belau co ed go ne or
+pwc
+py com coop edu gov mil net org
+qa com edu gov mil name net org sch
+qpon
+quebec
+quest
+racing
+radio
+re asso com nom
+read
+realestate
+realtor
+realty
+recipes
+red
+redstone
+redumbrella
+rehab
+reise
+reisen
+reit
+reliance
+ren
+rent
+rentals
+repair
+report
+republican
+rest
+restaurant
+review
+reviews
+rexroth
+rich
+richardli
+ricoh
+ril
+rio
+rip
+ro arts com firm info nom nt org rec store tm www
+rocher
+rocks
+rodeo
+rogers
+room
+rs ac co edu gov in org
+rsvp
+ru
+rugby
+ruhr
+run
+rw ac co coop gov mil net org
+rwe
+ryukyu
+sa com edu gov med net org pub sch
+saarland
+safe
+safety
+sakura
+sale
+salon
+samsclub
+samsung
+sandvik
+sandvikcoromant
+sanofi
+sap
+sarl
+sas
+save
+saxo
+sb com edu gov net org
+sbi
+sbs
+sc com edu gov net org
+sca
+scb
+schaeffler
+schmidt
+scholarships
+school
+schule
+schwarz
+science
+scot
+sd com edu gov info med net org tv
+se a ac b bd brand c d e f fh fhsk fhv g h i k komforb kommunalforbund komvux l lanbib m n naturbruksgymn o org p parti pp press r s t tm u w x y z
+search
+seat
+secure
+security
+seek
+select
+sener
+services
+seven
+sew
+sex
+sexy
+sfr
+sg com edu gov net org per
+sh com gov mil net org
+shangrila
+sharp
+shaw
+shell
+shia
+shiksha
+shoes
+shop
+shopping
+shouji
+show
+showtime
+si
+silk
+sina
+singles
+site
+sj
+sk
+ski
+skin
+sky
+skype
+sl com edu gov net org
+sling
+sm
+smart
+smile
+sn art com edu gouv org perso univ
+sncf
+so com edu gov me net org
+soccer
+social
+softbank
+software
+sohu
+solar
+solutions
+song
+sony
+soy
+spa
+space
+sport
+spot
+sr
+srl
+ss biz com edu gov me net org sch
+st co com consulado edu embaixada mil net org principe saotome store
+stada
+staples
+star
+statebank
+statefarm
+stc
+stcgroup
+stockholm
+storage
+store
+stream
+studio
+study
+style
+su
+sucks
+supplies
+supply
+support
+surf
+surgery
+suzuki
+sv com edu gob org red
+swatch
+swiss
+sx gov
+sy com edu gov mil net org
+sydney
+systems
+sz ac co org
+tab
+taipei
+talk
+taobao
+target
+tatamotors
+tatar
+tattoo
+tax
+taxi
+tc
+tci
+td
+tdk
+team
+tech
+technology
+tel
+temasek
+tennis
+teva
+tf
+tg
+th ac co go in mi net or
+thd
+theater
+theatre
+tiaa
+tickets
+tienda
+tiffany
+tips
+tires
+tirol
+tj ac biz co com edu go gov int mil name net nic org test web
+tjmaxx
+tjx
+tk
+tkmaxx
+tl gov
+tm co com edu gov mil net nom org
+tmall
+tn com ens fin gov ind info intl mincom nat net org perso tourism
+to com edu gov mil net org
+today
+tokyo
+tools
+top
+toray
+toshiba
+total
+tours
+town
+toyota
+toys
+tr av bbs bel biz com dr edu gen gov info k12 kep mil name nc net org pol tel tsk tv web
+trade
+trading
+training
+travel
+travelchannel
+travelers
+travelersinsurance
+trust
+trv
+tt aero biz co com coop edu gov info int jobs mobi museum name net org pro travel
+tube
+tui
+tunes
+tushu
+tv
+tvs
+tw club com ebiz edu game gov idv mil net org xn--czrw28b xn--uc0atv xn--zf0ao64a
+tz ac co go hotel info me mil mobi ne or sc tv
+ua cherkassy cherkasy chernigov chernihiv chernivtsi chernovtsy ck cn com cr crimea cv dn dnepropetrovsk dnipropetrovsk donetsk dp edu gov if in ivano-frankivsk kh kharkiv kharkov kherson khmelnitskiy khmelnytskyi kiev kirovograd km kr krym ks kv kyiv lg lt lugansk lutsk lv lviv mk mykolaiv net nikolaev od odesa odessa org pl poltava rivne rovno rv sb sebastopol sevastopol sm sumy te ternopil uz uzhgorod vinnica vinnytsia vn volyn yalta zaporizhzhe zaporizhzhia zhitomir zhytomyr zp zt
+ubank
+ubs
+ug ac co com go ne or org sc
+uk ac co gov ltd me net nhs org plc police
+unicom
+university
+uno
+uol
+ups
+us ak al ar as az ca co ct dc de dni fed fl ga gu hi ia id il in isa kids ks ky la ma md me mi mn mo ms mt nc nd ne nh nj nm nsn nv ny oh ok or pa pr ri sc sd tn tx ut va vi vt wa wi wv wy
+uy com edu gub mil net org
+uz co com net org
+va
+vacations
+vana
+vanguard
+vc com edu gov mil net org
+ve arts bib co com e12 edu firm gob gov info int mil net nom org rar rec store tec web
+vegas
+ventures
+verisign
+versicherung
+vet
+vg
+vi co com k12 net org
+viajes
+video
+vig
+viking
+villas
+vin
+vip
+virgin
+visa
+vision
+viva
+vivo
+vlaanderen
+vn ac biz com edu gov health info int name net org pro
+vodka
+volkswagen
+volvo
+vote
+voting
+voto
+voyage
+vu com edu net org
+vuelos
+wales
+walmart
+walter
+wang
+wanggou
+watch
+watches
+weather
+weatherchannel
+webcam
+weber
+website
+wedding
+weibo
+weir
+wf
+whoswho
+wien
+wiki
+williamhill
+win
+windows
+wine
+winners
+wme
+wolterskluwer
+woodside
+work
+works
+world
+wow
+ws com edu gov net org
+wtc
+wtf
+xbox
+xerox
+xfinity
+xihuan
+xin
+xn--11b4c3d
+xn--1ck2e1b
+xn--1qqw23a
+xn--2scrj9c
+xn--30rr7y
+xn--3bst00m
+xn--3ds443g
+xn--3e0b707e
+xn--3hcrj9c
+xn--3pxu8k
+xn--42c2d9a
+xn--45br5cyl
+xn--45brj9c
+xn--45q11c
+xn--4dbrk0ce xn--4dbgdty6c xn--5dbhl8d xn--8dbq2a xn--hebda8b
+xn--4gbrim
+xn--54b7fta0cc
+xn--55qw42g
+xn--55qx5d
+xn--5su34j936bgsg
+xn--5tzm5g
+xn--6frz82g
+xn--6qq986b3xl
+xn--80adxhks
+xn--80ao21a
+xn--80aqecdr1a
+xn--80asehdb
+xn--80aswg
+xn--8y0a063a
+xn--90a3ac xn--80au xn--90azh xn--c1avg xn--d1at xn--o1ac xn--o1ach
+xn--90ae
+xn--90ais
+xn--9dbq2a
+xn--9et52u
+xn--9krt00a
+xn--b4w605ferd
+xn--bck1b9a5dre4c
+xn--c1avg
+xn--c2br7g
+xn--cck2b3b
+xn--cckwcxetd
+xn--cg4bki
+xn--clchc0ea0b2g2a9gcd
+xn--czr694b
+xn--czrs0t
+xn--czru2d
+xn--d1acj3b
+xn--d1alf
+xn--e1a4c
+xn--eckvdtc9d
+xn--efvy88h
+xn--fct429k
+xn--fhbei
+xn--fiq228c5hs
+xn--fiq64b
+xn--fiqs8s
+xn--fiqz9s
+xn--fjq720a
+xn--flw351e
+xn--fpcrj9c3d
+xn--fzc2c9e2c
+xn--fzys8d69uvgm
+xn--g2xx48c
+xn--gckr3f0f
+xn--gecrj9c
+xn--gk3at1e
+xn--h2breg3eve
+xn--h2brj9c
+xn--h2brj9c8c
+xn--hxt814e
+xn--i1b6b1a6a2e
+xn--imr513n
+xn--io0a7i
+xn--j1aef
+xn--j1amh
+xn--j6w193g xn--55qx5d xn--gmqw5a xn--mxtq1m xn--od0alg xn--uc0atv xn--wcvs22d
+xn--jlq480n2rg
+xn--jvr189m
+xn--kcrx77d1x4a
+xn--kprw13d
+xn--kpry57d
+xn--kput3i
+xn--l1acc
+xn--lgbbat1ad8j
+xn--mgb2ddes
+xn--mgb9awbf
+xn--mgba3a3ejt
+xn--mgba3a4f16a
+xn--mgba3a4fra
+xn--mgba7c0bbn0a
+xn--mgbaakc7dvf
+xn--mgbaam7a8h
+xn--mgbab2bd
+xn--mgbah1a3hjkrd
+xn--mgbai9a5eva00b
+xn--mgbai9azgqp6j
+xn--mgbayh7gpa
+xn--mgbbh1a
+xn--mgbbh1a71e
+xn--mgbc0a9azcg
+xn--mgbca7dzdo
+xn--mgbcpq6gpa1a
+xn--mgberp4a5d4a87g
+xn--mgberp4a5d4ar
+xn--mgbgu82a
+xn--mgbi4ecexp
+xn--mgbpl2fh
+xn--mgbqly7c0a67fbc
+xn--mgbqly7cvafr
+xn--mgbt3dhd
+xn--mgbtf8fl
+xn--mgbtx2b
+xn--mgbx4cd0ab
+xn--mix082f
+xn--mix891f
+xn--mk1bu44c
+xn--mxtq1m
+xn--ngbc5azd
+xn--ngbe9e0a
+xn--ngbrx
+xn--nnx388a
+xn--node
+xn--nqv7f
+xn--nqv7fs00ema
+xn--nyqy26a
+xn--o3cw4h xn--12c1fe0br xn--12cfi8ixb8l xn--12co0c3b4eva xn--h3cuzk1di xn--m3ch0j3a xn--o3cyx2a
+xn--ogbpf8fl
+xn--otu796d
+xn--p1acf
+xn--p1ai
+xn--pgbs0dh
+xn--pssy2u
+xn--q7ce6a
+xn--q9jyb4c
+xn--qcka1pmc
+xn--qxa6a
+xn--qxam
+xn--rhqv96g
+xn--rovu88b
+xn--rvc1e0am3e
+xn--s9brj9c
+xn--ses554g
+xn--t60b56a
+xn--tckwe
+xn--tiq49xqyj
+xn--unup4y
+xn--vermgensberater-ctb
+xn--vermgensberatung-pwb
+xn--vhquv
+xn--vuq861b
+xn--w4r85el8fhu5dnra
+xn--w4rs40l
+xn--wgbh1c
+xn--wgbl6a
+xn--xhq521b
+xn--xkc2al3hye2a
+xn--xkc2dl3a5ee0h
+xn--y9a3aq
+xn--yfro4i67o
+xn--ygbi2ammx
+xn--zfr164b
+xxx
+xyz
+yachts
+yahoo
+yamaxun
+yandex
+ye com edu gov mil net org
+yodobashi
+yoga
+yokohama
+you
+youtube
+yt
+yun
+za ac agric alt co edu gov grondar law mil net ngo nic nis nom org school tm web
+zappos
+zara
+zero
+zip
+zm ac biz co com edu gov info mil net org sch
+zone
+zuerich
+zw ac co gov mil org
+"""
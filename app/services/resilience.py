@@ -0,0 +1,364 @@
+"""上流API呼び出しのリトライ間隔・サーキットブレーカー・同時実行数と送信ペースの制御"""
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, List, Mapping, Optional, Tuple
+from config import get_logger
+from app.core.exceptions import OverloadedError
+
+logger = get_logger()
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """指数バックオフ（full jitter）。attempt は0始まりのリトライ回数"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """連続失敗が閾値に達したら一定時間呼び出しを止めるブレーカー
+
+    closed: 通常 / open: 即座に失敗させる / half_open: 1件だけ試行して復旧を確認する
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._transition("half_open")
+        # half_open では同時に1件だけ試行する
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def abandon(self):
+        # 上流に送らずに終わった試行（結果をブレーカーに反映しない）
+        self._probing = False
+
+    def record_success(self):
+        if self.state != "closed":
+            self._transition("closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self._transition("open")
+            self.opened_at = time.monotonic()
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+
+    def snapshot(self) -> Dict:
+        retry_in = None
+        if self.state == "open":
+            retry_in = max(0.0, round(self.reset_timeout - (time.monotonic() - self.opened_at), 1))
+        return {"state": self.state, "failures": self.failures, "retry_in": retry_in}
+
+class AdaptiveLimiter:
+    """上流の応答に応じて同時実行数の上限を調整するリミッター（AIMD）
+
+    成功するたびに上限を少しずつ増やし（1往復あたり約+1）、429/5xx・タイムアウトや
+    目標を超える遅延を観測したら上限を乗算的に減らす。上限を超えた呼び出しは
+    有界のキューで待機し、キューが満杯か待機がタイムアウトした場合は OverloadedError になる。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+        latency_target: float = 0.0,
+        decrease_ratio: float = 0.7
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.decrease_ratio = decrease_ratio
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._latency: Optional[float] = None  # 遅延の指数移動平均
+        self._last_decrease = 0.0
+        self.stats = {"rejected": 0, "queue_timeouts": 0, "decreases": 0}
+
+    async def acquire(self):
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise OverloadedError(f"{self.name} is overloaded", retry_after=self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["queue_timeouts"] += 1
+            raise OverloadedError(f"{self.name} is overloaded", retry_after=self.retry_after())
+        except BaseException:
+            # 枠を割り当てられた直後にキャンセルされた場合は枠を返す
+            if future.done() and not future.cancelled():
+                self.inflight -= 1
+                self._wake()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            try:
+                self._waiters.remove(future)
+            except ValueError:
+                pass
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False):
+        """枠を返す。latency は上流の応答時間（不明ならNone）"""
+        self.inflight -= 1
+        if latency is not None:
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        if overloaded or (self.latency_target > 0 and latency is not None and latency > self.latency_target):
+            self._decrease()
+        elif latency is not None and self.inflight + 1 >= int(self.limit):
+            # 上限まで使い切っている場合だけ増やす（アイドル時に上限が膨らまないように）
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        self._wake()
+
+    def _decrease(self):
+        # 同時に失敗した呼び出しで何度も減らさないよう、1往復に1回までにする
+        now = time.monotonic()
+        if now - self._last_decrease < (self._latency or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_ratio)
+        self.stats["decreases"] += 1
+
+    def _wake(self):
+        while self._waiters and self.inflight < int(self.limit):
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.inflight += 1
+            future.set_result(None)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self._latency or 1.0))
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "queued": len(self._waiters)
+        }
+
+# QuotaPacer の優先度（値が小さいほど優先）
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 1
+
+# 残りクォータとリセットまでの時間を示すレスポンスヘッダー（先に見つかったものを使う）
+REMAINING_HEADERS = ("x-ratelimit-remaining", "ratelimit-remaining")
+LIMIT_HEADERS = ("x-ratelimit-limit", "ratelimit-limit")
+RESET_HEADERS = ("x-ratelimit-reset", "ratelimit-reset")
+
+def _header_number(headers: Mapping[str, str], names: Tuple[str, ...]) -> Optional[float]:
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value.split(",")[0])
+        except ValueError:
+            return None
+    return None
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After（秒数またはHTTP日付）を秒数にする"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class QuotaPacer:
+    """上流のクォータに合わせて送信ペースを制御するトークンバケット
+
+    トークンが無い場合は優先度順のキューで待機する。レスポンスの残りクォータと
+    リセット時刻から送信レートを下げ、429/Retry-After を受けたらその間は送信を止める。
+    バックグラウンドの処理は残りクォータが少ない間は送らず、待機も low_priority_timeout までとする。
+    クォータを複数のプロセスで分け合う場合は shares にプロセス数を渡す（レート・バースト・
+    残りクォータをその数で割った分だけ使う）。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        low_priority_timeout: float,
+        low_priority_reserve: float,
+        shares: int = 1
+    ):
+        self.name = name
+        self.shares = max(1, shares)
+        self.max_rate = rate / self.shares
+        self.rate = self.max_rate
+        self.burst = max(1, burst // self.shares)
+        self.low_priority_timeout = low_priority_timeout
+        self.low_priority_reserve = low_priority_reserve
+        self.tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._quota_fraction: Optional[float] = None  # 直近のレスポンスが示す残りクォータの割合
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"paced": 0, "low_priority_skips": 0, "pauses": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rate > 0
+
+    async def acquire(self, priority: int = PRIORITY_USER) -> bool:
+        """送信してよければTrue。バックグラウンドの処理を見送る場合はFalse"""
+        if not self.enabled:
+            return True
+        low_priority = priority > PRIORITY_USER
+        if low_priority and self._quota_fraction is not None and self._quota_fraction < self.low_priority_reserve:
+            self.stats["low_priority_skips"] += 1
+            return False
+
+        now = time.monotonic()
+        self._refill(now)
+        if not self._waiters and now >= self._paused_until and self.tokens >= 1:
+            self.tokens -= 1
+            return True
+
+        self.stats["paced"] += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._schedule()
+        try:
+            await asyncio.wait_for(future, timeout=self.low_priority_timeout if low_priority else None)
+            return True
+        except asyncio.TimeoutError:
+            self.stats["low_priority_skips"] += 1
+            return False
+        except BaseException:
+            # 割り当て直後にキャンセルされた場合はトークンを返す
+            if future.done() and not future.cancelled():
+                self.tokens += 1
+                self._schedule()
+            raise
+        finally:
+            if future.cancelled():
+                self._discard_cancelled()
+
+    def _discard_cancelled(self):
+        self._waiters = [waiter for waiter in self._waiters if not waiter[2].done()]
+        heapq.heapify(self._waiters)
+        self._schedule()
+
+    def observe(self, status_code: int, headers: Mapping[str, str]):
+        """レスポンスのレート制限ヘッダーを送信ペースに反映する"""
+        if not self.enabled:
+            return
+        retry_after = parse_retry_after(headers.get("retry-after"))
+        if status_code == 429 or retry_after:
+            self._pause(retry_after or 1.0)
+
+        remaining = _header_number(headers, REMAINING_HEADERS)
+        if remaining is None:
+            return
+        limit = _header_number(headers, LIMIT_HEADERS)
+        if limit:
+            self._quota_fraction = remaining / limit
+        reset = _header_number(headers, RESET_HEADERS)
+        if reset is None:
+            return
+        # エポック秒で返す実装もある
+        if reset > 1e9:
+            reset -= time.time()
+        reset = max(reset, 1.0)
+        if remaining < 1:
+            self._pause(reset)
+        else:
+            # 残りのクォータ（のうちこのプロセスの取り分）をリセットまでの時間で均等に使う
+            remaining /= self.shares
+            self.rate = min(self.max_rate, remaining / reset)
+            self.tokens = min(self.tokens, remaining)
+
+    def _refill(self, now: float):
+        if now < self._paused_until:
+            self._last = now
+            return
+        self.tokens = min(float(self.burst), self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def _pause(self, seconds: float):
+        now = time.monotonic()
+        if now + seconds > self._paused_until:
+            self._paused_until = now + seconds
+            self.stats["pauses"] += 1
+            logger.warning(f"{self.name} quota: pausing requests for {seconds:.1f}s")
+        self.tokens = 0.0
+        self._last = now
+        if self._waiters:
+            self._schedule()
+
+    def _schedule(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters and now >= self._paused_until and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        if self._waiters:
+            delay = max(self._paused_until - now, (1 - self.tokens) / self.rate, 0.001)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._schedule)
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "rate": round(self.rate, 2),
+            "tokens": round(self.tokens, 2),
+            "queued": len(self._waiters),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "quota_remaining": None if self._quota_fraction is None else round(self._quota_fraction, 3)
+        }
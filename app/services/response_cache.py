@@ -0,0 +1,82 @@
+from cachetools import TTLCache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from app.core.metrics import RESPONSE_CACHE_REQUESTS, labelled
+from app.models.messages import MCPRequest, Message
+from config import get_logger, get_settings
+import hashlib
+import json
+
+logger = get_logger()
+settings = get_settings()
+
+class ResponseCache:
+    """同一リクエストに対するClaudeの応答（JSON本体）のキャッシュ
+
+    temperature=0 の非ストリーミングのリクエストのみ対象。キーにはRFのコンテキストを
+    注入した後のメッセージを含めるため、RFの情報が変われば別のエントリになる。
+    サイズは応答本体のバイト数で制限し、超えた分はLRUで捨てる。
+    """
+
+    def __init__(self):
+        self.enabled = settings.RESPONSE_CACHE_ENABLED
+        self._entries: TTLCache = TTLCache(
+            maxsize=settings.RESPONSE_CACHE_MAX_BYTES,
+            ttl=settings.RESPONSE_CACHE_TTL,
+            getsizeof=len
+        )
+        self.stats = {"hits": 0, "misses": 0, "bypasses": 0, "stores": 0}
+
+    def cache_key(self, mcp_request: MCPRequest, messages: List[Message]) -> Optional[str]:
+        """キャッシュ対象外のリクエストならNone"""
+        if not self.enabled or mcp_request.stream or mcp_request.temperature != 0:
+            return None
+        canonical = json.dumps(
+            {
+                "messages": [[m.role, m.get_text(), m.name] for m in messages],
+                "model": mcp_request.model,
+                "max_tokens": mcp_request.max_tokens,
+                "temperature": mcp_request.temperature,
+                "system": mcp_request.system
+            },
+            ensure_ascii=False,
+            separators=(",", ":")
+        )
+        return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def directives(cache_control: Optional[str]) -> FrozenSet[str]:
+        if not cache_control:
+            return frozenset()
+        return frozenset(d.split("=", 1)[0].strip().lower() for d in cache_control.split(","))
+
+    def lookup(self, key: str, directives: FrozenSet[str]) -> Tuple[str, Optional[bytes]]:
+        """(X-Response-Cacheの値, キャッシュ済みの本体) を返す"""
+        # no-cache / no-store はキャッシュを使わずに上流へ問い合わせる
+        if "no-cache" in directives or "no-store" in directives:
+            return self._count("BYPASS", "bypasses"), None
+        body = self._entries.get(key)
+        if body is None:
+            return self._count("MISS", "misses"), None
+        return self._count("HIT", "hits"), body
+
+    def store(self, key: str, body: bytes, directives: FrozenSet[str]):
+        if "no-store" in directives:
+            return
+        try:
+            self._entries[key] = body
+        except ValueError:
+            # 1件で上限を超える応答は保存しない
+            logger.debug(f"Response too large to cache: {len(body)} bytes")
+            return
+        self.stats["stores"] += 1
+
+    def _count(self, result: str, stat: str) -> str:
+        self.stats[stat] += 1
+        labelled(RESPONSE_CACHE_REQUESTS, result.lower()).inc()
+        return result
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "entries": len(self._entries), "bytes": int(self._entries.currsize)}
@@ -1,58 +1,457 @@
+import asyncio
 import httpx
-from typing import Dict, Optional
+import time
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Set, Tuple
 from config import get_settings, get_logger
 from app.core.exceptions import RFAPIException
-from .cache import RFCache
+from app.core import timing
+from app.core.metrics import RF_IN_PROGRESS, observe_rf_response
+from .cache import CacheEntry, RFCache
+from .http_pool import create_client, pool_stats
+from .public_suffix import normalize_hostname
+from .resilience import (
+    PRIORITY_BACKGROUND, PRIORITY_USER, CircuitBreaker, QuotaPacer, backoff_delay, parse_retry_after
+)
 
 settings = get_settings()
 logger = get_logger()
 
+# IOCタイプごとの単体ルックアップパス
+ENTITY_PATHS = {
+    "ip": "/ip/{}",
+    "domain": "/domain/{}",
+    "vulnerability": "/vulnerability/{}",
+    "hash": "/hash/{}"
+}
+
+# リトライ対象のステータスコード（レート制限と一時的なサーバーエラー）
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# バルクエンドポイントが返すエンティティ種別とIOCタイプの対応
+BULK_ENTITY_TYPES = {
+    "IpAddress": "ip",
+    "InternetDomainName": "domain",
+    "CyberVulnerability": "vulnerability",
+    "Hash": "hash"
+}
+
 class RFClient:
     def __init__(self, cache: RFCache):
         self.base_url = settings.RF_API_BASE_URL
         self.api_key = settings.RF_API_KEY
         self.cache = cache
-        self.client = httpx.AsyncClient(
-            base_url=self.base_url,
-            headers={"X-RFToken": self.api_key},
-            timeout=30.0
+        # httpxクライアントはワーカーのlifespanで start() / aclose() する
+        self.client: Optional[httpx.AsyncClient] = None
+        # 実行中のルックアップ {(type, value): future}
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # 低優先度で実行中のキャッシュ更新（ユーザーのルックアップは相乗りしない）
+        self._refreshes: Set[asyncio.Future] = set()
+        # 呼び出し元が待たなくなった後も継続するタスク（GCされないよう参照を保持する）
+        self._background: Set[asyncio.Future] = set()
+        self.stats = {
+            "upstream_requests": 0,
+            "coalesced_hits": 0,
+            "bulk_requests": 0,
+            "negative_hits": 0,
+            "stale_hits": 0,
+            "background_refreshes": 0,
+            "deadline_skips": 0,
+            "retries": 0,
+            "breaker_rejections": 0
+        }
+        # エンドポイント（IOCタイプ・bulk）ごとのサーキットブレーカー
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # RFのクォータに合わせた送信ペース（全エンドポイント共通）
+        self.pacer = QuotaPacer(
+            "RF API",
+            rate=settings.RF_QUOTA_RATE,
+            burst=settings.RF_QUOTA_BURST,
+            low_priority_timeout=settings.RF_QUOTA_LOW_PRIORITY_TIMEOUT,
+            low_priority_reserve=settings.RF_QUOTA_LOW_PRIORITY_RESERVE,
+            shares=settings.RF_QUOTA_WORKERS
         )
 
-    async def _make_request(self, path: str, params: Optional[Dict] = None) -> Dict:
+    def start(self):
+        if self.client is None:
+            self.client = create_client(
+                base_url=self.base_url,
+                headers={"X-RFToken": self.api_key},
+                timeout=settings.RF_REQUEST_TIMEOUT,
+                max_connections=settings.RF_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.RF_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.RF_KEEPALIVE_EXPIRY,
+                http2=settings.RF_HTTP2
+            )
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def pool_stats(self) -> Dict[str, int]:
+        return pool_stats(self.client, settings.RF_MAX_CONNECTIONS)
+
+    def breaker_states(self) -> Dict[str, Dict]:
+        return {name: breaker.snapshot() for name, breaker in self._breakers.items()}
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(
+                f"rf:{endpoint}",
+                failure_threshold=settings.RF_BREAKER_FAILURE_THRESHOLD,
+                reset_timeout=settings.RF_BREAKER_RESET_TIMEOUT
+            )
+        return breaker
+
+    async def _make_request(
+        self,
+        path: str,
+        params: Optional[Dict] = None,
+        method: str = "GET",
+        json: Optional[Any] = None,
+        ioc_type: str = "other",
+        priority: int = PRIORITY_USER
+    ) -> Dict:
+        """RFへのリクエスト。一時的なエラーはバックオフ付きでリトライする
+
+        エンドポイント（IOCタイプ）ごとのブレーカーが開いている間は上流に送らず即座に失敗する。
+        送信はクォータに合わせてペース配分し、priority の低い処理はユーザーのルックアップに譲る。
+        """
+        breaker = self._breaker(ioc_type)
+        if not breaker.allow():
+            self.stats["breaker_rejections"] += 1
+            raise RFAPIException(f"RF circuit open for {ioc_type}", status_code=503)
+
+        attempt = 0
+        while True:
+            try:
+                paced = await self.pacer.acquire(priority)
+            except BaseException:
+                breaker.abandon()
+                raise
+            if not paced:
+                breaker.abandon()
+                raise RFAPIException("RF quota reserved for user lookups", status_code=429)
+            try:
+                result = await self._send(path, params, method, json, ioc_type)
+            except RFAPIException as e:
+                retryable = self._is_retryable(e)
+                delay = backoff_delay(attempt, settings.RF_RETRY_BACKOFF_BASE, settings.RF_RETRY_BACKOFF_MAX)
+                # Retry-After はその間は待つ。RF_RETRY_BACKOFF_MAX より長ければリトライせず失敗とする
+                retry_after = e.details.get("retry_after")
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                # half_open の試行はリトライせず結果をそのままブレーカーに反映する
+                if (retryable and attempt < settings.RF_MAX_RETRIES and breaker.state == "closed"
+                        and delay <= settings.RF_RETRY_BACKOFF_MAX):
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                # 404などRFが正常に応答したエラーは障害として数えない
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                raise
+            except asyncio.CancelledError:
+                # 呼び出し元のキャンセルは上流の障害ではないため、結果をブレーカーに反映しない
+                breaker.abandon()
+                raise
+            breaker.record_success()
+            return result
+
+    @staticmethod
+    def _is_retryable(error: RFAPIException) -> bool:
+        # タイムアウトや接続エラーは status_code=500 として送出される
+        return error.status_code in RETRYABLE_STATUSES
+
+    async def _send(
+        self,
+        path: str,
+        params: Optional[Dict],
+        method: str,
+        json: Optional[Any],
+        ioc_type: str
+    ) -> Dict:
+        self.stats["upstream_requests"] += 1
+        status = "error"
+        start = time.perf_counter()
+        RF_IN_PROGRESS.inc()
         try:
-            response = await self.client.get(path, params=params)
+            response = await self.client.request(method, path, params=params, json=json)
+            status = str(response.status_code)
+            self.pacer.observe(response.status_code, response.headers)
             response.raise_for_status()
             return response.json()
         except httpx.HTTPStatusError as e:
             logger.error(f"RF API error: {str(e)}")
-            raise RFAPIException(str(e), status_code=e.response.status_code)
+            retry_after = parse_retry_after(e.response.headers.get("retry-after"))
+            raise RFAPIException(
+                str(e),
+                status_code=e.response.status_code,
+                details={"retry_after": retry_after} if retry_after is not None else None
+            )
+        except httpx.TimeoutException as e:
+            status = "timeout"
+            logger.error(f"RF API timeout: {str(e)}")
+            raise RFAPIException(str(e))
         except Exception as e:
             logger.error(f"Unexpected error in RF API request: {str(e)}")
             raise RFAPIException(str(e))
+        finally:
+            RF_IN_PROGRESS.dec()
+            observe_rf_response(ioc_type, status, time.perf_counter() - start)
 
-    async def get_ip_info(self, ip: str) -> Dict:
-        cached = self.cache.get("ip", ip)
-        if cached:
-            return cached
+    async def _get_entity(self, entity_type: str, value: str) -> Dict:
+        entry = self._get_cached(entity_type, value)
+        if entry is not None:
+            if entry.negative:
+                raise self._not_found(entity_type, value)
+            return entry.value
 
-        result = await self._make_request(f"/ip/{ip}")
-        self.cache.set("ip", ip, result)
-        return result
+        # 同じIOCへの同時ミスは1本の上流リクエストを共有する
+        key = (entity_type, value)
+        future = self._joinable(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_entity(entity_type, value))
+            self._register_inflight(key, future)
+        else:
+            self.stats["coalesced_hits"] += 1
 
-    async def get_domain_info(self, domain: str) -> Dict:
-        cached = self.cache.get("domain", domain)
-        if cached:
-            return cached
+        # 呼び出し元のキャンセルやタイムアウトで共有タスクを止めない
+        return await asyncio.shield(future)
+
+    def _get_cached(self, entity_type: str, value: str) -> Optional[CacheEntry]:
+        entry = self.cache.get_entry(entity_type, value)
+        if entry is None:
+            return None
+        if entry.negative:
+            self.stats["negative_hits"] += 1
+        elif self.cache.is_stale(entity_type, entry):
+            # ハードTTLまでは古い値を即座に返し、再取得は1本だけ裏で走らせる
+            self.stats["stale_hits"] += 1
+            self._refresh_in_background(entity_type, value)
+        return entry
+
+    def _refresh_in_background(self, entity_type: str, value: str):
+        key = (entity_type, value)
+        if key in self._inflight:
+            return
+        self.stats["background_refreshes"] += 1
+        future = asyncio.ensure_future(self._fetch_entity(entity_type, value, priority=PRIORITY_BACKGROUND))
+        self._refreshes.add(future)
+        self._register_inflight(key, future)
 
-        result = await self._make_request(f"/domain/{domain}")
-        self.cache.set("domain", domain, result)
+    async def _fetch_entity(self, entity_type: str, value: str, priority: int = PRIORITY_USER) -> Dict:
+        try:
+            result = await self._make_request(
+                ENTITY_PATHS[entity_type].format(value), ioc_type=entity_type, priority=priority
+            )
+        except RFAPIException as e:
+            if e.status_code == 404:
+                self.cache.set_negative(entity_type, value)
+            raise
+        if self._is_unknown(result):
+            self.cache.set_negative(entity_type, value)
+            raise self._not_found(entity_type, value)
+        self.cache.set(entity_type, value, result)
         return result
 
+    @staticmethod
+    def _is_unknown(result: Dict) -> bool:
+        # RFが空のデータで「未知のIOC」を返した場合
+        return not result or ("data" in result and not result["data"])
+
+    @staticmethod
+    def _not_found(entity_type: str, value: str) -> RFAPIException:
+        return RFAPIException(f"No RF data for {entity_type} {value}", status_code=404)
+
+    def _joinable(self, key: Tuple[str, str]) -> Optional[asyncio.Future]:
+        # 低優先度の更新に相乗りするとクォータの待機・見送りを引き継ぐため、
+        # ユーザーのルックアップは新たに取得する（更新はそのまま完了させる）
+        future = self._inflight.get(key)
+        if future is None or future in self._refreshes:
+            return None
+        return future
+
+    def _register_inflight(self, key: Tuple[str, str], future: asyncio.Future):
+        self._inflight[key] = future
+        future.add_done_callback(lambda f: self._on_fetch_done(key, f))
+
+    def _on_fetch_done(self, key: Tuple[str, str], future: asyncio.Future):
+        self._refreshes.discard(future)
+        # ユーザーのルックアップに置き換えられていればそちらを残す
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # 待機者が全員いなくなった場合でも例外を回収済みにしておく
+        if not future.cancelled():
+            future.exception()
+
+    def _track_background(self, future: asyncio.Future):
+        self._background.add(future)
+        future.add_done_callback(self._on_background_done)
+
+    def _on_background_done(self, future: asyncio.Future):
+        self._background.discard(future)
+        if not future.cancelled():
+            future.exception()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "inflight": len(self._inflight), "background": len(self._background)}
+
+    async def get_ip_info(self, ip: str) -> Dict:
+        return await self._get_entity("ip", ip)
+
+    async def get_domain_info(self, domain: str) -> Dict:
+        # キャッシュのキーはIOC抽出と同じ正規化済みのホスト名にそろえる
+        return await self._get_entity("domain", normalize_hostname(domain) or domain)
+
     async def get_vulnerability_info(self, cve: str) -> Dict:
-        cached = self.cache.get("vulnerability", cve)
-        if cached:
-            return cached
+        return await self._get_entity("vulnerability", cve)
 
-        result = await self._make_request(f"/vulnerability/{cve}")
-        self.cache.set("vulnerability", cve, result)
-        return result
+    async def get_hash_info(self, file_hash: str) -> Dict:
+        return await self._get_entity("hash", file_hash)
+
+    async def lookup_many(
+        self,
+        iocs: Iterable[Tuple[str, str]],
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[Tuple[str, str], Optional[Dict]]:
+        """(type, value) の一覧をまとめて取得する
+
+        RFに存在しないIOCはNone、取得に失敗したIOCは結果に含めない。
+        deadline（秒）を過ぎても終わらないルックアップは結果に含めず、
+        裏で継続してキャッシュを埋める。
+        """
+        concurrency = concurrency or settings.RF_ENRICH_CONCURRENCY
+        timeout = timeout or settings.RF_LOOKUP_TIMEOUT
+
+        results: Dict[Tuple[str, str], Optional[Dict]] = {}
+        misses: List[Tuple[str, str]] = []
+        for key in dict.fromkeys(iocs):
+            if key[0] not in ENTITY_PATHS:
+                logger.debug(f"Unsupported IOC type for lookup: {key[0]}")
+                continue
+            entry = self._get_cached(*key)
+            if entry is None:
+                misses.append(key)
+            else:
+                results[key] = entry.value
+        timing.count("rf_hit", len(results))
+        timing.count("rf_miss", len(misses))
+        if not misses:
+            return results
+
+        semaphore = asyncio.Semaphore(concurrency)
+        if settings.RF_BULK_ENRICHMENT_PATH:
+            waiters = self._start_bulk_fetch(misses, semaphore, timeout)
+        else:
+            waiters = [self._bounded(self._get_entity(*key), semaphore, timeout) for key in misses]
+
+        # 一部の失敗は他のルックアップに影響させない
+        tasks = [asyncio.ensure_future(waiter) for waiter in waiters]
+        done: Set[asyncio.Future] = set()
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=deadline)
+        finally:
+            for task in tasks:
+                if task not in done:
+                    self._track_background(task)
+
+        for key, task in zip(misses, tasks):
+            if task not in done:
+                self.stats["deadline_skips"] += 1
+                continue
+            error = task.exception()
+            if isinstance(error, RFAPIException) and error.status_code == 404:
+                results[key] = None
+            elif error is not None:
+                logger.debug(f"RF lookup failed for {key[0]} {key[1]}: {error!r}")
+            else:
+                results[key] = task.result()
+        return results
+
+    async def _bounded(self, coro, semaphore: asyncio.Semaphore, timeout: Optional[float]):
+        async with semaphore:
+            return await asyncio.wait_for(coro, timeout=timeout)
+
+    def _start_bulk_fetch(
+        self,
+        misses: List[Tuple[str, str]],
+        semaphore: asyncio.Semaphore,
+        timeout: float
+    ) -> List[Awaitable]:
+        # 既に実行中のキーは相乗りし、残りをチャンク単位でバルク取得する
+        waiters: List[Awaitable] = []
+        pending: List[Tuple[str, str]] = []
+        loop = asyncio.get_running_loop()
+        for key in misses:
+            future = self._joinable(key)
+            if future is None:
+                future = loop.create_future()
+                self._register_inflight(key, future)
+                pending.append(key)
+            else:
+                self.stats["coalesced_hits"] += 1
+            # timeout で打ち切るのは待機だけにする（_get_entity と同じく取得は止めない）
+            waiters.append(asyncio.wait_for(asyncio.shield(future), timeout=timeout))
+
+        # チャンクの取得は RF_REQUEST_TIMEOUT とリトライで上限が決まるので、完了させてキャッシュを埋める
+        chunk_size = settings.RF_BULK_CHUNK_SIZE
+        for i in range(0, len(pending), chunk_size):
+            chunk = pending[i:i + chunk_size]
+            task = asyncio.ensure_future(
+                self._bounded(self._fetch_bulk_chunk(chunk), semaphore, None)
+            )
+            task.add_done_callback(lambda t, chunk=chunk: self._resolve_chunk(chunk, t))
+            self._track_background(task)
+        return waiters
+
+    async def _fetch_bulk_chunk(self, chunk: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict]:
+        payload: Dict[str, List[str]] = {}
+        for entity_type, value in chunk:
+            payload.setdefault(entity_type, []).append(value)
+
+        self.stats["bulk_requests"] += 1
+        data = await self._make_request(
+            settings.RF_BULK_ENRICHMENT_PATH, method="POST", json=payload, ioc_type="bulk"
+        )
+
+        found: Dict[Tuple[str, str], Dict] = {}
+        for item in data.get("data", {}).get("results", []):
+            entity = item.get("entity", {})
+            entity_type = BULK_ENTITY_TYPES.get(entity.get("type"))
+            if entity_type and entity.get("name"):
+                name = entity["name"]
+                # 国際化ドメイン名がUnicodeで返っても問い合わせたA-labelと対応付ける
+                name = (normalize_hostname(name) or name) if entity_type == "domain" else name.lower()
+                found[(entity_type, name)] = item
+        return found
+
+    def _resolve_chunk(self, chunk: List[Tuple[str, str]], task: asyncio.Task):
+        error: Optional[BaseException] = None
+        found: Dict[Tuple[str, str], Dict] = {}
+        if task.cancelled():
+            error = RFAPIException("Bulk lookup cancelled")
+        elif task.exception() is not None:
+            error = task.exception()
+        else:
+            found = task.result()
+
+        for key in chunk:
+            future = self._inflight.get(key)
+            if future is None or future.done():
+                continue
+            result = found.get((key[0], key[1].lower()))
+            if error is not None:
+                future.set_exception(error)
+            elif result is None:
+                self.cache.set_negative(*key)
+                future.set_exception(self._not_found(*key))
+            else:
+                self.cache.set(key[0], key[1], result)
+                future.set_result(result)
@@ -0,0 +1,98 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional, Tuple
+from config import get_logger
+
+logger = get_logger()
+
+class SharedCacheStore:
+    """同一ホスト上の全ワーカーで共有するSQLiteキャッシュ層"""
+
+    # 期限切れエントリを掃除する書き込み間隔
+    PURGE_INTERVAL = 500
+    # イベントループ上で同期的に呼ばれるため、ロック待ちは短く打ち切ってキャッシュミスとして扱う
+    BUSY_TIMEOUT = 0.05
+
+    def __init__(self, path: str, max_entries: int = 40000):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+        self.stats = {"busy": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        # fork後の子プロセスでは接続を作り直す
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rf_cache ("
+                " cache_type TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (cache_type, key)"
+                ") WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS rf_cache_expires ON rf_cache (expires_at)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, cache_type: str, key: str) -> Optional[Tuple[Optional[Dict[str, Any]], float]]:
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM rf_cache"
+                " WHERE cache_type = ? AND key = ? AND expires_at > ?",
+                (cache_type, key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._log_error("read", e)
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, cache_type: str, key: str, value: Optional[Dict[str, Any]], expires_at: float):
+        # ネガティブエントリはJSONのnullとして保存する
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO rf_cache (cache_type, key, value, expires_at)"
+                " VALUES (?, ?, ?, ?)",
+                (cache_type, key, json.dumps(value, separators=(",", ":")), expires_at)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_INTERVAL == 0:
+                self._purge(conn)
+        except sqlite3.Error as e:
+            self._log_error("write", e)
+
+    def _purge(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM rf_cache WHERE expires_at <= ?", (time.time(),))
+        # 上限を超えた分は期限の近いものから削除する
+        (count,) = conn.execute("SELECT COUNT(*) FROM rf_cache").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM rf_cache WHERE (cache_type, key) IN ("
+                " SELECT cache_type, key FROM rf_cache ORDER BY expires_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def _log_error(self, operation: str, error: sqlite3.Error):
+        # 他のワーカーの書き込み中（busy/locked）は想定内なので件数だけ数える
+        if isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error)):
+            self.stats["busy"] += 1
+            logger.debug(f"Shared cache {operation} skipped: {str(error)}")
+            return
+        logger.warning(f"Shared cache {operation} failed: {str(error)}")
+
+    def clear(self):
+        try:
+            self._connection().execute("DELETE FROM rf_cache")
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache clear failed: {str(e)}")
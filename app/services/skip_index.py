@@ -0,0 +1,191 @@
+"""RFに問い合わせないIOCの索引（プライベート・予約済みのIP範囲と許可リスト）
+
+IP範囲は重複をまとめた区間の開始・終了のソート済み配列を二分探索し、
+ドメインはラベルを逆順にたどるトライで「そのドメインかサブドメイン」を判定する。
+許可リストのファイルは更新時刻を見て別スレッドで読み直し、完成した索引に差し替える
+（読み込み中と、読み込みに失敗した場合は前の索引を使い続ける）。
+"""
+import asyncio
+import ipaddress
+import os
+import time
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import get_logger
+from .public_suffix import normalize_hostname
+
+logger = get_logger()
+
+# プライベート・ループバック・リンクローカル・ドキュメント用などの範囲（RFC 6890 ほか）
+RESERVED_NETWORKS = (
+    "0.0.0.0/8", "10.0.0.0/8", "100.64.0.0/10", "127.0.0.0/8", "169.254.0.0/16",
+    "172.16.0.0/12", "192.0.0.0/24", "192.0.2.0/24", "192.168.0.0/16", "198.18.0.0/15",
+    "198.51.100.0/24", "203.0.113.0/24", "224.0.0.0/4", "240.0.0.0/4",
+    "::1/128", "100::/64", "2001:db8::/32", "fc00::/7", "fe80::/10", "ff00::/8"
+)
+# 予約済み・内部用のドメイン（RFC 2606 / 6761 / 8375）
+RESERVED_DOMAINS = (
+    "localhost", "local", "internal", "test", "example", "invalid", "home.arpa",
+    "example.com", "example.net", "example.org"
+)
+
+def _network_range(network: str) -> Tuple[int, int, int]:
+    """(IPバージョン, 先頭アドレス, 末尾アドレス)"""
+    net = ipaddress.ip_network(network, strict=False)
+    return net.version, int(net.network_address), int(net.broadcast_address)
+
+_RESERVED_RANGES = tuple(_network_range(network) for network in RESERVED_NETWORKS)
+
+_TERMINAL = ""  # トライの終端マーカー（空のラベルは出現しない）
+
+class IntervalIndex:
+    """整数区間の集合。重なり・隣接する区間はまとめておく"""
+
+    def __init__(self, ranges: Iterable[Tuple[int, int]]):
+        starts: List[int] = []
+        ends: List[int] = []
+        for start, end in sorted(ranges):
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self._starts = starts
+        self._ends = ends
+
+    def __contains__(self, value: int) -> bool:
+        i = bisect_right(self._starts, value) - 1
+        return i >= 0 and value <= self._ends[i]
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+class DomainTrie:
+    """ドメインのサフィックスのトライ（com -> example -> www の順にたどる）"""
+
+    def __init__(self, domains: Iterable[str]):
+        self._root: Dict = {}
+        self.size = 0
+        for domain in domains:
+            node = self._root
+            for label in reversed(domain.split(".")):
+                node = node.setdefault(label, {})
+            if _TERMINAL not in node:
+                node[_TERMINAL] = True
+                self.size += 1
+
+    def __contains__(self, domain: str) -> bool:
+        node = self._root
+        for label in reversed(domain.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+            if _TERMINAL in node:
+                return True
+        return False
+
+class SkipIndex:
+    def __init__(self, include_reserved: bool = True, path: Optional[str] = None, reload_interval: float = 10.0):
+        self.include_reserved = include_reserved
+        self.path = path
+        self.reload_interval = reload_interval
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._reload_task: Optional[asyncio.Future] = None
+        self.stats = {"skipped": 0, "reloads": 0, "reload_errors": 0}
+        self._build([], [])
+        if self.path:
+            self._next_check = time.monotonic() + self.reload_interval
+            self._reload()
+
+    def _build(self, networks: List[Tuple[int, int, int]], domains: List[str]):
+        if self.include_reserved:
+            networks = [*_RESERVED_RANGES, *networks]
+            domains = [*RESERVED_DOMAINS, *domains]
+        ranges: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+        for version, start, end in networks:
+            ranges[version].append((start, end))
+        # 参照を差し替えるだけなので、処理中のルックアップは古い索引か新しい索引のどちらかを使う
+        self._ip_index = {version: IntervalIndex(r) for version, r in ranges.items()}
+        self._domains = DomainTrie(domains)
+
+    def maybe_reload(self):
+        """許可リストのファイルが更新されていれば読み直す（確認は reload_interval 秒に1回）"""
+        if not self.path or self._reload_task is not None:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        # 数万件の解析でイベントループやリクエストを止めないよう別スレッドで行う
+        self._reload_task = asyncio.ensure_future(asyncio.to_thread(self._reload))
+        self._reload_task.add_done_callback(self._reload_done)
+
+    def _reload_done(self, task: asyncio.Future):
+        self._reload_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to reload skip list {self.path}: {str(task.exception())}")
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self._mtime:
+                return
+            networks, domains = self._parse(self.path)
+            self._build(networks, domains)
+        except (OSError, ValueError) as e:
+            self.stats["reload_errors"] += 1
+            logger.error(f"Failed to load skip list {self.path}: {str(e)}")
+            return
+        self._mtime = mtime
+        self.stats["reloads"] += 1
+        logger.info(f"Loaded skip list: {len(networks)} networks, {len(domains)} domains")
+
+    @staticmethod
+    def _parse(path: str) -> Tuple[List[Tuple[int, int, int]], List[str]]:
+        # 1行1件（IPアドレス・CIDR・ドメイン）。# 以降はコメント
+        networks, domains = [], []
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                entry = line.split("#", 1)[0].strip().lower()
+                if not entry:
+                    continue
+                # 数字で始まるか ":" を含むものだけIPとして解釈を試す
+                if entry[0].isdigit() or ":" in entry:
+                    try:
+                        networks.append(_network_range(entry))
+                        continue
+                    except ValueError:
+                        pass
+                # "*.corp.example" や ".corp.example" も受け付ける。IOC抽出と同じくA-labelにそろえる
+                domain = entry.lstrip("*").strip(".")
+                if "/" in domain or " " in domain:
+                    domain = None
+                domain = domain and normalize_hostname(domain)
+                if not domain:
+                    raise ValueError(f"line {number}: invalid entry {entry!r}")
+                domains.append(domain)
+        return networks, domains
+
+    def should_skip(self, ioc_type: str, value: str) -> bool:
+        if ioc_type == "ip":
+            try:
+                address = ipaddress.ip_address(value)
+            except ValueError:
+                return False
+            return int(address) in self._ip_index[address.version]
+        if ioc_type == "domain":
+            return value in self._domains
+        return False
+
+    def filter(self, iocs: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        kept = [ioc for ioc in iocs if not self.should_skip(*ioc)]
+        self.stats["skipped"] += len(iocs) - len(kept)
+        return kept
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "ip_ranges": sum(len(index) for index in self._ip_index.values()),
+            "domains": self._domains.size
+        }
@@ -0,0 +1,77 @@
+"""RFコンテキスト整形のサイズと所要時間
+
+IOC数ごとに、従来の整形（1件1セクション・上限なし）と
+ContextFormatter（リスク順・低リスクは表・トークン予算）のサイズと時間を比較する。
+
+    python -m benchmarks.bench_context_formatter --counts 10,100,1000 --budget 1500
+"""
+import argparse
+import hashlib
+import os
+import time
+
+os.environ.setdefault("RF_API_KEY", "stub")
+os.environ.setdefault("CLAUDE_API_KEY", "stub")
+
+from app.services.context_formatter import ContextFormatter, estimate_tokens
+
+def legacy_format(context):
+    # 変更前の ContextEnhancer._format_context
+    formatted = ["Recorded Future Intelligence:"]
+    for key, value in context.items():
+        formatted.append(f"\n{key}:")
+        if "risk" in value:
+            formatted.append(f"Risk Score: {value['risk'].get('score', 'N/A')}")
+        if "timestamps" in value:
+            formatted.append(f"First Seen: {value['timestamps'].get('firstSeen', 'N/A')}")
+    return "\n".join(formatted)
+
+def make_context(count: int):
+    # tools/rf_stub_server.py と同じく値から決定的にスコアを決める（0〜100にほぼ均等に分布）
+    context = {}
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            key = f"ip_203.0.{i // 256 % 256}.{i % 256}"
+        elif kind == 1:
+            key = f"domain_host{i}.example.com"
+        else:
+            key = f"vulnerability_CVE-2024-{10000 + i}"
+        digest = hashlib.sha256(key.encode()).digest()
+        context[key] = {
+            "risk": {"score": digest[0] * 100 // 255, "criticalityLabel": "Unusual"},
+            "timestamps": {"firstSeen": "2024-01-01T00:00:00.000Z"}
+        }
+    return context
+
+def bench(func, context, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = func(context)
+        best = min(best, time.perf_counter() - start)
+    return text, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", default="10,50,100,500,1000")
+    parser.add_argument("--budget", type=int, default=1500)
+    parser.add_argument("--detail-min-risk", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    formatter = ContextFormatter(token_budget=args.budget, detail_min_risk=args.detail_min_risk)
+    print(f"budget: {args.budget} tokens, detail_min_risk: {args.detail_min_risk}, best of {args.repeat}")
+    print(f"{'iocs':>6}{'legacy tok':>12}{'legacy ms':>11}{'budget tok':>12}{'budget ms':>11}  omitted")
+    for count in (int(c) for c in args.counts.split(",")):
+        context = make_context(count)
+        legacy, legacy_time = bench(legacy_format, context, args.repeat)
+        budgeted, budget_time = bench(formatter.format, context, args.repeat)
+        omitted = budgeted.rsplit("(", 1)[-1].split(" ")[0] if budgeted.endswith("budget)") else "0"
+        print(
+            f"{count:>6}{estimate_tokens(legacy):>12}{legacy_time * 1000:>11.3f}"
+            f"{estimate_tokens(budgeted):>12}{budget_time * 1000:>11.3f}  {omitted}"
+        )
+
+if __name__ == "__main__":
+    main()
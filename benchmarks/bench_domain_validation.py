@@ -0,0 +1,98 @@
+"""ドメイン検証によるRFルックアップ数の削減
+
+benchmarks/corpus/soc_chat.txt のメッセージから、公開サフィックスリストによる検証前の
+抽出（正規表現のみ）と IOCExtractor がRFに問い合わせるドメインを比較する。
+EXPECTED_DOMAINS に挙げたドメインが1つでも落ちたら回帰として終了コード1を返す。
+紛らわしいTLDのルールはラベル数だけで判定するため、gunicorn.conf.py は残り transfer.sh は落ちる。
+zip は既定で対象外のため、ファイル名の setup.zip も問い合わせる。
+日本語の文に空白なしで続くドメイン（「cdn.jp-secure-login.comへの」）は文字種の変わり目で切り出す。
+
+    python -m benchmarks.bench_domain_validation
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+os.environ.setdefault("RF_API_KEY", "stub")
+os.environ.setdefault("CLAUDE_API_KEY", "stub")
+
+from config import get_settings
+from app.services.ioc_extractor import IOCExtractor
+from app.services.skip_index import SkipIndex
+
+CORPUS = os.path.join(os.path.dirname(__file__), "corpus", "soc_chat.txt")
+
+# 変更前の IOCExtractor と同じパターン
+LEGACY_PATTERN = re.compile(
+    r"""
+    (?P<vulnerability>\bCVE-\d{4}-\d{4,7}\b)
+    | (?P<hash>\b(?:[0-9a-f]{64}|[0-9a-f]{40}|[0-9a-f]{32})\b)
+    | (?P<ipv4>(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?!\d|\.\d))
+    | (?P<ipv6>(?<![\w:.])(?:[0-9a-f]{0,4}:){2,7}[0-9a-f]{0,4}(?![\w:]))
+    | (?P<domain>(?<![\w.-])(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z][a-z0-9-]{0,61}[a-z0-9](?![\w-]|\.[a-z0-9]))
+    """,
+    re.IGNORECASE | re.VERBOSE
+)
+
+# コーパス中の実在する（RFに問い合わせるべき）ドメイン
+EXPECTED_DOMAINS = {
+    "cdn-update.micros0ft-support.com", "invoices-secure.co.uk", "login.office365-verify.xyz",
+    "update-check.top", "files.evil-cdn.sh", "api.telemetry-sync.ru", "dl.payload-host.com.py",
+    "kraken-wallet-login.net", "xn--pple-43d.com", "statics-cdn.icu", "mail.statics-cdn.icu",
+    "c2.darkpulse.cc", "c2-backup.darkpulse.cc", "share.filedrop-secure.zip",
+    "xn--bcherei-login-wob.de", "mail.xn--bcherei-login-wob.de", "xn----8sbcooqjmlkd.xn--p1ai",
+    "login-microsoftonline.help", "secure-docs.review", "account-verify.support",
+    "ghcr.io", "storage.googleapis.com", "pastebin.com",
+    "cdn.jp-secure-login.com", "update.jp-news-cdn.net",
+}
+
+def read_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        text = "".join(line for line in f if not line.startswith("#"))
+    return [message.strip() for message in text.split("\n\n") if message.strip()]
+
+def legacy_domains(text: str):
+    return list(dict.fromkeys(
+        match.group().lower() for match in LEGACY_PATTERN.finditer(text) if match.lastgroup == "domain"
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    settings = get_settings()
+    extractor = IOCExtractor(settings.DOMAIN_AMBIGUOUS_TLDS, settings.DOMAIN_AMBIGUOUS_MIN_LABELS)
+    skip_index = SkipIndex()
+    messages = read_corpus(args.corpus)
+
+    legacy, validated = set(), set()
+    for message in messages:
+        legacy.update(legacy_domains(message))
+        iocs = skip_index.filter(extractor.extract(message))
+        validated.update(value for ioc_type, value in iocs if ioc_type == "domain")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for message in messages:
+            extractor.extract(message)
+    per_message = (time.perf_counter() - start) / (args.repeat * len(messages))
+
+    print(f"messages: {len(messages)}, extraction {per_message * 1e6:.1f} us/message")
+    print(f"domain lookups: legacy {len(legacy)}, validated {len(validated)} "
+          f"({1 - len(validated) / len(legacy):.0%} fewer upstream calls)")
+    print(f"dropped: {', '.join(sorted(legacy - validated))}")
+    print(f"added (IDN, next to Japanese text): {', '.join(sorted(validated - legacy))}")
+    missing = EXPECTED_DOMAINS - validated
+    unexpected = validated - EXPECTED_DOMAINS
+    if unexpected:
+        print(f"looked up but not in EXPECTED_DOMAINS: {', '.join(sorted(unexpected))}")
+    if missing:
+        print(f"REGRESSION: expected domains not extracted: {', '.join(sorted(missing))}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
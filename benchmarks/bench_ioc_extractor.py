@@ -0,0 +1,108 @@
+"""IOC抽出のスループット比較
+
+大きなログ貼り付けを模したテキストに対して、従来の3正規表現方式と
+IOCExtractor（1回の走査＋検証＋重複排除）を比較する。
+日本語に直接続くIOC（JAPANESE_CASES）を1つでも取りこぼしたら回帰として終了コード1を返す。
+
+    python -m benchmarks.bench_ioc_extractor --megabytes 5
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+os.environ.setdefault("RF_API_KEY", "stub")
+os.environ.setdefault("CLAUDE_API_KEY", "stub")
+
+from app.services.ioc_extractor import IOCExtractor
+
+# 変更前の ContextEnhancer と同じパターン
+LEGACY_IP = re.compile(r'\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b')
+LEGACY_DOMAIN = re.compile(r'\b(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9][a-z0-9-]{0,61}[a-z0-9]\b')
+LEGACY_CVE = re.compile(r'CVE-\d{4}-\d{4,7}', re.IGNORECASE)
+
+# 日本語の文中に空白なしで書かれたIOC
+JAPANESE_CASES = [
+    ("脆弱性CVE-2024-3094の影響は？", ("vulnerability", "CVE-2024-3094")),
+    ("ハッシュd41d8cd98f00b204e9800998ecf8427eを確認", ("hash", "d41d8cd98f00b204e9800998ecf8427e")),
+    ("検体のSHA256はe3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855です",
+     ("hash", "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855")),
+    ("送信元185.220.101.47からの通信", ("ip", "185.220.101.47")),
+    ("宛先は2606:4700::1111で、", ("ip", "2606:4700::1111")),
+]
+
+def legacy_extract(text: str):
+    ips = list(dict.fromkeys(LEGACY_IP.findall(text)))
+    domains = [d for d in dict.fromkeys(LEGACY_DOMAIN.findall(text)) if d not in ips]
+    cves = list(dict.fromkeys(c.upper() for c in LEGACY_CVE.findall(text)))
+    return [("ip", v) for v in ips] + [("domain", v) for v in domains] + [("vulnerability", v) for v in cves]
+
+def make_log(size: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    templates = [
+        "{ts} INFO  nginx[{pid}]: {ip} - - \"GET /api/v{ver}/items HTTP/1.1\" 200 {n} \"-\" \"curl/{ver}\"",
+        "{ts} WARN  sshd[{pid}]: Failed password for root from {ip} port {n} ssh2",
+        "{ts} ERROR proxy: upstream host{n}.{domain} resolved to {ip6} timed out after {n}ms",
+        "{ts} INFO  edr: quarantined file sha256={sha256} md5={md5} on host WS-{n}",
+        "{ts} ALERT ids: exploit attempt matching {cve} from {bad_ip} against app.{domain}",
+        "{ts} DEBUG worker: loaded config.py, logging.handlers and main.py (build {ver}.{n})",
+    ]
+    domains = ["example.com", "corp.example.net", "evil-c2.xyz", "cdn.example.org"]
+    lines, total = [], 0
+    while total < size:
+        line = rng.choice(templates).format(
+            ts=f"2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}Z",
+            pid=rng.randint(100, 99999),
+            ip=f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+            bad_ip=f"{rng.randint(256, 999)}.{rng.randint(0, 255)}.1.1",
+            ip6=f"2001:db8:{rng.randint(0, 65535):x}::{rng.randint(1, 65535):x}",
+            n=rng.randint(1, 65535),
+            ver=f"{rng.randint(1, 9)}.{rng.randint(0, 30)}.{rng.randint(0, 9)}",
+            domain=rng.choice(domains),
+            sha256=f"{rng.getrandbits(256):064x}",
+            md5=f"{rng.getrandbits(128):032x}",
+            cve=f"CVE-20{rng.randint(10, 24)}-{rng.randint(1000, 99999)}",
+        )
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+def bench(name: str, func, text: str, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        best = min(best, time.perf_counter() - start)
+    counts = {}
+    for ioc_type, _ in result:
+        counts[ioc_type] = counts.get(ioc_type, 0) + 1
+    mb = len(text) / 1_000_000
+    print(f"{name:<10}{best:>9.3f}s{mb / best:>9.1f} MB/s  {counts}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=float, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = make_log(int(args.megabytes * 1_000_000))
+    print(f"input: {len(text) / 1_000_000:.1f} MB, best of {args.repeat}")
+    legacy = bench("legacy", legacy_extract, text, args.repeat)
+    single = bench("single", IOCExtractor().extract, text, args.repeat)
+
+    invalid_ips = sum(1 for t, v in legacy if t == "ip" and any(int(o) > 255 for o in v.split(".")))
+    numeric_domains = sum(1 for t, v in legacy if t == "domain" and v.split(".")[-1].isdigit())
+    print(f"legacy false positives: {invalid_ips} invalid IPs, {numeric_domains} numeric 'domains'")
+    print(f"unique IOCs: legacy {len(legacy)}, single {len(single)}")
+
+    extractor = IOCExtractor()
+    missing = [text for text, expected in JAPANESE_CASES if expected not in extractor.extract(text)]
+    if missing:
+        print(f"REGRESSION: IOCs next to Japanese text not extracted: {', '.join(missing)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""ミドルウェアスタックのスループット比較（/health）
+
+変更前の BaseHTTPMiddleware ×2 + @app.middleware("http") 構成と、
+GatewayMiddleware 1層の構成で、同じアプリに対する1秒あたりの処理件数を比較する。
+ネットワークを挟まずASGIアプリを直接呼び出すため、ミドルウェア自体のコストが見える。
+
+    python -m benchmarks.bench_middleware --requests 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+os.environ.setdefault("RF_API_KEY", "stub")
+os.environ.setdefault("CLAUDE_API_KEY", "stub")
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.api.middleware import GatewayMiddleware
+from app.core.maintenance import maintenance
+from config import get_logger
+
+# 変更前の RequestMiddleware / SecurityMiddleware / maintenance_middleware と同等の処理
+class LegacyRequestMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        request_id = str(uuid.uuid4())
+        request.state.request_id = request_id
+        start_time = time.time()
+        get_logger().info(f"Incoming request: {request.method} {request.url.path}")
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        get_logger().info(f"Request completed in {process_time:.3f}s")
+        response.headers["X-Request-ID"] = request_id
+        response.headers["X-Process-Time"] = str(process_time)
+        return response
+
+class LegacySecurityMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        if "user-agent" not in request.headers:
+            raise HTTPException(status_code=400, detail="Missing required header: user-agent")
+        response = await call_next(request)
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        return response
+
+def build_app(legacy: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    if legacy:
+        app.add_middleware(LegacyRequestMiddleware)
+        app.add_middleware(LegacySecurityMiddleware)
+
+        @app.middleware("http")
+        async def maintenance_middleware(request: Request, call_next):
+            if maintenance.is_active and not maintenance.is_path_allowed(request.url.path):
+                return JSONResponse(status_code=503, content={"error": "System under maintenance"})
+            return await call_next(request)
+    else:
+        app.add_middleware(GatewayMiddleware)
+    return app
+
+async def call(app, scope):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(dict(scope), receive, send)
+    return sent[0]["status"]
+
+async def run(app, total: int, concurrency: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/health", "raw_path": b"/health",
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80), "headers": [(b"host", b"testserver"), (b"user-agent", b"bench")],
+    }
+    assert await call(app, scope) == 200
+    start = time.perf_counter()
+    for _ in range(total // concurrency):
+        await asyncio.gather(*(call(app, scope) for _ in range(concurrency)))
+    return (total // concurrency * concurrency) / (time.perf_counter() - start)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    # ログ出力のコストを除外する
+    get_logger().setLevel(logging.WARNING)
+
+    results = {}
+    for name, legacy in (("legacy", True), ("gateway", False)):
+        app = build_app(legacy)
+        results[name] = await run(app, args.requests, args.concurrency)
+        print(f"{name:<8}{results[name]:>10.0f} req/s")
+    print(f"speedup  {results['gateway'] / results['legacy']:>10.2f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""SkipIndex のルックアップ時間
+
+ランダムなCIDRとドメインを許可リストのファイルに書き出して読み込み、
+区間の二分探索・ドメインのトライと、ネットワーク・サフィックスを順に照合する方式の
+1件あたりのルックアップ時間を比較する。
+
+    python -m benchmarks.bench_skip_index --networks 50000 --domains 50000
+"""
+import argparse
+import ipaddress
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("RF_API_KEY", "stub")
+os.environ.setdefault("CLAUDE_API_KEY", "stub")
+
+from app.services.skip_index import SkipIndex
+
+def make_skip_list(networks: int, domains: int, rng: random.Random):
+    nets = [
+        str(ipaddress.ip_network(f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.0/{rng.randint(16, 28)}", strict=False))
+        for _ in range(networks)
+    ]
+    names = [f"svc{i}.corp{rng.randint(0, 999)}.example-{rng.randint(0, 99)}.com" for i in range(domains)]
+    return nets, names
+
+def make_queries(count: int, rng: random.Random, names):
+    queries = []
+    for i in range(count):
+        if i % 2:
+            queries.append(("ip", f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"))
+        elif i % 4 == 0:
+            queries.append(("domain", f"www.{rng.choice(names)}"))
+        else:
+            queries.append(("domain", f"host{i}.unrelated{rng.randint(0, 999)}.net"))
+    return queries
+
+def linear_skip(networks, domains):
+    parsed = [ipaddress.ip_network(n) for n in networks]
+    def should_skip(ioc_type, value):
+        if ioc_type == "ip":
+            address = ipaddress.ip_address(value)
+            return any(address in net for net in parsed)
+        return any(value == d or value.endswith("." + d) for d in domains)
+    return should_skip
+
+def bench(name: str, func, queries, baseline=None):
+    start = time.perf_counter()
+    result = [func(*q) for q in queries]
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8}{elapsed / len(queries) * 1e6:>10.2f} us/lookup  skipped {sum(result)}/{len(queries)}")
+    if baseline is not None and baseline != result:
+        print(f"{name}: results differ from baseline")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--networks", type=int, default=50000)
+    parser.add_argument("--domains", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=100000)
+    parser.add_argument("--linear-queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    networks, domains = make_skip_list(args.networks, args.domains, rng)
+    queries = make_queries(args.queries, rng, domains)
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("\n".join(networks + domains))
+    try:
+        start = time.perf_counter()
+        index = SkipIndex(include_reserved=False, path=f.name)
+        print(f"load: {time.perf_counter() - start:.3f}s  {index.get_stats()}")
+    finally:
+        os.unlink(f.name)
+
+    bench("index", index.should_skip, queries)
+    # 順に照合する方式は遅いので件数を絞って比較する
+    sample = queries[:args.linear_queries]
+    baseline = bench("linear", linear_skip(networks, domains), sample)
+    bench("index", index.should_skip, sample, baseline)
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,172 @@
+import atexit
 import logging
 import logging.handlers
+import queue
+import threading
 from pythonjsonlogger import jsonlogger
 from datetime import datetime
+from typing import List, Optional
 
 class SecurityAwareJsonFormatter(jsonlogger.JsonFormatter):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.sensitive_fields = {'api_key', 'token', 'password', 'secret'}
 
+    def add_fields(self, log_record, record, message_dict):
+        super().add_fields(log_record, record, message_dict)
+        # 書き込みスレッドでの整形時刻ではなく、イベントの発生時刻を使う
+        log_record['timestamp'] = datetime.utcfromtimestamp(record.created).isoformat()
+
     def process_log_record(self, log_record):
-        log_record['timestamp'] = datetime.utcnow().isoformat()
         for field in self.sensitive_fields:
             if field in log_record:
                 log_record[field] = "***MASKED***"
         return super().process_log_record(log_record)
 
-def setup_logging(log_level: str = "INFO"):
+class BatchEmitMixin:
+    """複数レコードをまとめてJSON化し、1回の書き込みで出力する"""
+
+    def emit_batch(self, records: List[logging.LogRecord]):
+        lines = []
+        for record in records:
+            if record.levelno < self.level or not self.filter(record):
+                continue
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        payload = self.terminator.join(lines) + self.terminator
+        with self.lock:
+            try:
+                self._before_write(payload)
+                self.stream.write(payload)
+                self.flush()
+            except Exception:
+                self.handleError(records[-1])
+
+    def _before_write(self, payload: str):
+        pass
+
+class BatchStreamHandler(BatchEmitMixin, logging.StreamHandler):
+    pass
+
+class BatchRotatingFileHandler(BatchEmitMixin, logging.handlers.RotatingFileHandler):
+    def _before_write(self, payload: str):
+        # ローテーション判定はバッチ単位で行う
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes > 0 and self.stream.tell() + len(payload) >= self.maxBytes:
+            self.doRollover()
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """イベントループ上ではキューへの投入だけを行うハンドラー
+
+    キューが満杯の場合はブロックせず、overflowに従って破棄する
+    （"drop_new": 新しいレコードを破棄 / "drop_oldest": 最も古いレコードを破棄）。
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = "drop_new"):
+        super().__init__(log_queue)
+        if overflow not in ("drop_new", "drop_oldest"):
+            raise ValueError(f"Unknown log overflow policy: {overflow}")
+        self.overflow = overflow
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # メッセージの整形は書き込みスレッドで行う（遅延フォーマット）
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        self.dropped += 1
+
+class BatchingQueueListener:
+    """キューからまとめてレコードを取り出し、各ハンドラーに一括で渡す書き込みスレッド"""
+
+    _sentinel = None
+
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        handlers: List[logging.Handler],
+        queue_handler: BoundedQueueHandler,
+        batch_size: int = 256
+    ):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.queue_handler = queue_handler
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        # 残っているレコードを書き出してから終了する
+        self.queue.put(self._sentinel)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            records = [self.queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = self._sentinel in records
+            records = [r for r in records if r is not self._sentinel]
+            dropped, self.queue_handler.dropped = self.queue_handler.dropped, 0
+            if dropped:
+                records.append(logging.makeLogRecord({
+                    "name": "mcp_server",
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": "Dropped %d log records (log queue full)",
+                    "args": (dropped,)
+                }))
+            if records:
+                self._emit(records)
+            if stopping:
+                return
+
+    def _emit(self, records: List[logging.LogRecord]):
+        for handler in self.handlers:
+            if isinstance(handler, BatchEmitMixin):
+                handler.emit_batch(records)
+            else:
+                for record in records:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+
+def setup_logging(
+    log_level: str = "INFO",
+    queue_size: int = 10000,
+    overflow: str = "drop_new",
+    batch_size: int = 256
+):
     logger = logging.getLogger("mcp_server")
     logger.setLevel(getattr(logging, log_level))
 
     # ファイルハンドラー
-    file_handler = logging.handlers.RotatingFileHandler(
+    file_handler = BatchRotatingFileHandler(
         'logs/mcp_server.log',
         maxBytes=10*1024*1024,
         backupCount=5
@@ -30,13 +176,24 @@ def setup_logging(log_level: str = "INFO"):
     ))
 
     # コンソールハンドラー
-    console_handler = logging.StreamHandler()
+    console_handler = BatchStreamHandler()
     console_handler.setFormatter(SecurityAwareJsonFormatter(
         '%(timestamp)s %(levelname)s %(message)s'
     ))
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # 書き込みは専用スレッドで行い、イベントループをディスクI/Oで止めない
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    queue_handler = BoundedQueueHandler(log_queue, overflow=overflow)
+    listener = BatchingQueueListener(
+        log_queue,
+        [file_handler, console_handler],
+        queue_handler,
+        batch_size=batch_size
+    )
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.addHandler(queue_handler)
 
     return logger
 
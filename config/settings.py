@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings # type: ignore
 from functools import lru_cache
 
@@ -12,6 +12,108 @@ class Settings(BaseSettings):
     ALLOWED_HOSTS: List[str] = ["*"]
     CORS_ORIGINS: List[str] = ["*"]
     LOG_LEVEL: str = "INFO"
+    # ログは専用スレッドで書き込む。キューが満杯の場合は drop_new / drop_oldest に従って破棄する
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_QUEUE_OVERFLOW: str = "drop_new"
+    LOG_BATCH_SIZE: int = 256
+    API_KEY_HEADER: str = "X-API-Key"
+
+    # レート制限（トークンバケット。rate: 1秒あたりの補充数、burst: 容量）
+    # 送信元はASGIのクライアントIPで数えるため、プロキシの背後で有効にする場合は
+    # gunicorn.conf.py の FORWARDED_ALLOW_IPS にプロキシのアドレスを設定する（既定では無効）
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMIT_DEFAULT: Dict[str, float] = {"rate": 10, "burst": 50}
+    # ルートごとのポリシー（指定したルートは送信元ごとに別のバケットになる）
+    RATE_LIMIT_ROUTES: Dict[str, Dict[str, float]] = {"/v1/messages": {"rate": 2, "burst": 20}}
+    # 登録済みAPIキーごとのポリシー（全ルート共通のバケット）。未登録のキーはIPで制限する
+    RATE_LIMIT_API_KEYS: Dict[str, Dict[str, float]] = {}
+    RATE_LIMIT_EXEMPT_PATHS: List[str] = ["/health", "/metrics"]
+    RATE_LIMIT_MAX_KEYS: int = 100000
+    # 設定すると全ワーカーでバケットを共有する（例: /dev/shm/mcp_rate_limit）
+    RATE_LIMIT_SHARED_PATH: Optional[str] = None
+
+    # レスポンスに処理時間の内訳（Server-Timing）を付与する
+    SERVER_TIMING: bool = True
+
+    # キャッシュ設定
+    CACHE_TTL: int = 300  # 5分
+    CACHE_MAX_SIZE: int = 1000
+    CACHE_NEGATIVE_TTLS: Dict[str, int] = {"ip": 60, "domain": 120, "vulnerability": 600, "hash": 120}
+    # ソフトTTL（秒）を設定したタイプは、期限までの残り期間に古い値を返しつつ裏で再取得する
+    CACHE_SOFT_TTLS: Dict[str, int] = {}  # 例: {"ip": 240, "vulnerability": 1500}
+    SHARED_CACHE_PATH: Optional[str] = None  # 例: "/dev/shm/mcp_rf_cache.db"
+    SHARED_CACHE_MAX_ENTRIES: int = 40000  # 1件あたり約5KB。/dev/shm に置く場合はその容量に収める
+    CACHE_SNAPSHOT_PATH: Optional[str] = None  # 例: "/var/lib/mcp/rf_cache.snapshot.gz"
+    CACHE_SNAPSHOT_INTERVAL: int = 300
+    CACHE_SNAPSHOT_MAX_ENTRIES: int = 200000
+
+    # RFエンリッチメント設定
+    RF_ENRICH_CONCURRENCY: int = 10
+    RF_LOOKUP_TIMEOUT: float = 5.0
+    RF_BULK_ENRICHMENT_PATH: Optional[str] = None  # 例: "/soar/enrichment"
+    RF_BULK_CHUNK_SIZE: int = 100
+    # 1回の試行あたりのタイムアウトと、一時的なエラー（429/5xx/タイムアウト）のリトライ
+    RF_REQUEST_TIMEOUT: float = 10.0
+    RF_MAX_RETRIES: int = 2
+    RF_RETRY_BACKOFF_BASE: float = 0.2
+    RF_RETRY_BACKOFF_MAX: float = 2.0  # Retry-After がこれより長い応答はリトライしない
+    # 連続失敗がこの回数に達したら RF_BREAKER_RESET_TIMEOUT 秒間そのエンドポイントを呼ばない
+    RF_BREAKER_FAILURE_THRESHOLD: int = 5
+    RF_BREAKER_RESET_TIMEOUT: float = 30.0
+    # RFへの送信ペース（1秒あたりのリクエスト数。0で無効）。レート制限ヘッダーを受けると自動で下げる
+    # 契約しているRFのクォータに合わせて設定する（既定では無効）
+    RF_QUOTA_RATE: float = 0.0
+    RF_QUOTA_BURST: int = 20
+    # クォータを分け合うワーカー数（gunicorn.conf.py が設定する）。各ワーカーは 1/N ずつ使う
+    RF_QUOTA_WORKERS: int = 1
+    # キャッシュ更新などのバックグラウンド処理は、残りクォータがこの割合未満なら送らず、
+    # 待機も RF_QUOTA_LOW_PRIORITY_TIMEOUT 秒までとする
+    RF_QUOTA_LOW_PRIORITY_RESERVE: float = 0.2
+    RF_QUOTA_LOW_PRIORITY_TIMEOUT: float = 5.0
+    ENRICH_DEADLINE_MS: int = 300  # 0以下で無効（全ルックアップを待つ）
+    ENRICH_MEMO_MAX_SIZE: int = 10000
+    ENRICH_MEMO_TTL: int = 300
+    # 1メッセージ分のRFコンテキストの上限（おおよそのトークン数。0以下で無制限）。
+    # リスクスコアが ENRICH_CONTEXT_DETAIL_MIN_RISK 未満のIOCは表にまとめる
+    ENRICH_CONTEXT_TOKEN_BUDGET: int = 1500
+    ENRICH_CONTEXT_DETAIL_MIN_RISK: int = 25
+    # RFに問い合わせないIOC。予約済みのIP範囲・ドメインに加えて、許可リストのファイル
+    # （1行1件のIP・CIDR・ドメイン）を指定できる。ファイルは更新されると自動で読み直す
+    SKIP_RESERVED_RANGES: bool = True
+    SKIP_LIST_PATH: Optional[str] = None  # 例: "/etc/mcp/skip_list.txt"
+    SKIP_LIST_RELOAD_INTERVAL: float = 10.0
+    # ファイルの拡張子と紛らわしいTLD（config.py・deploy.sh など）は、ホスト名のラベル数が
+    # DOMAIN_AMBIGUOUS_MIN_LABELS 以上（例: cdn.evil.sh）の場合だけドメインとして扱う
+    # zip・mov はフィッシングに多用される実在のgTLDのため既定では含めない
+    DOMAIN_AMBIGUOUS_TLDS: List[str] = ["py", "sh", "rs", "md", "pl", "pm", "so", "ps", "tf", "java"]
+    DOMAIN_AMBIGUOUS_MIN_LABELS: int = 3
+
+    # temperature=0 の同一リクエストに対する応答キャッシュ（オプトイン）
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESPONSE_CACHE_TTL: int = 3600
+
+    # 上流APIの接続プール設定（HTTP/2を有効にする場合は h2 パッケージが必要）
+    RF_MAX_CONNECTIONS: int = 100
+    RF_MAX_KEEPALIVE_CONNECTIONS: int = 100
+    RF_KEEPALIVE_EXPIRY: float = 30.0
+    RF_HTTP2: bool = False
+    CLAUDE_MAX_CONNECTIONS: int = 100
+    CLAUDE_MAX_KEEPALIVE_CONNECTIONS: int = 100
+    CLAUDE_KEEPALIVE_EXPIRY: float = 30.0
+    CLAUDE_HTTP2: bool = False
+
+    # Claude APIの同時リクエスト数（AIMDで MIN〜MAX の間を自動調整する）
+    CLAUDE_CONCURRENCY_INITIAL: int = 20
+    CLAUDE_CONCURRENCY_MIN: int = 2
+    CLAUDE_CONCURRENCY_MAX: int = 100
+    # 上限を超えたリクエストの待機キュー。満杯・待機タイムアウトで503（Retry-After付き）を返す
+    CLAUDE_QUEUE_SIZE: int = 100
+    CLAUDE_QUEUE_TIMEOUT: float = 10.0
+    # 応答（ストリームはヘッダー受信）までの時間がこれを超えたら上限を下げる。0で無効
+    CLAUDE_LATENCY_TARGET: float = 45.0
+    # システムプロンプトとRFコンテキストにプロンプトキャッシュのブレークポイントを付ける
+    CLAUDE_PROMPT_CACHE: bool = True
 
     class Config:
         env_file = ".env"
@@ -1,5 +1,6 @@
 import multiprocessing
 import os
+import shutil
 
 # サーバーソケット
 bind = os.getenv("BIND", "0.0.0.0:8000")
@@ -7,6 +8,8 @@ bind = os.getenv("BIND", "0.0.0.0:8000")
 # ワーカープロセス
 workers = int(os.getenv("WORKERS", multiprocessing.cpu_count() * 2 + 1))
 worker_class = "uvicorn.workers.UvicornWorker"
+# RFのクォータ（RF_QUOTA_RATE）はワーカー数で等分する
+os.environ.setdefault("RF_QUOTA_WORKERS", str(workers))
 
 # タイムアウト設定
 timeout = int(os.getenv("TIMEOUT", 30))
@@ -21,7 +24,26 @@ accesslog = os.getenv("ACCESS_LOG", "/var/log/gunicorn/access.log")
 errorlog = os.getenv("ERROR_LOG", "/var/log/gunicorn/error.log")
 loglevel = os.getenv("LOG_LEVEL", "warning")
 
+# X-Forwarded-For を信頼するプロキシ（ロードバランサー・composeのリバースプロキシなど）。
+# 設定しないとレート制限やログのクライアントIPがすべてプロキシのアドレスになる
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
 # セキュリティ設定
 limit_request_line = 4094
 limit_request_fields = 100
 limit_request_field_size = 8190
+
+# Prometheusメトリクス（各ワーカーの値をmmapファイル経由で合算する）
+# ワーカーがprometheus_clientを読み込む前に設定しておく必要がある
+prometheus_multiproc_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/mcp_prometheus_multiproc"
+)
+
+def on_starting(server):
+    # 前回起動時のワーカーの値を持ち越さない
+    shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+    os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
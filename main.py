@@ -4,17 +4,51 @@ from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException
 from fastapi.middleware.cors import CORSMiddleware # type: ignore
-from app.api import router, RequestMiddleware
-from app.core.maintenance import setup_maintenance_middleware
-from app.core.middleware import SecurityMiddleware
+from app.api import router, GatewayMiddleware
+from app.api.routes import rf_cache, rf_client, claude_client
 from config import get_settings, setup_logging
+from contextlib import asynccontextmanager, suppress
+import asyncio
 import os
 
 settings = get_settings()
-logger = setup_logging(settings.LOG_LEVEL)
+logger = setup_logging(
+    settings.LOG_LEVEL,
+    queue_size=settings.LOG_QUEUE_SIZE,
+    overflow=settings.LOG_QUEUE_OVERFLOW,
+    batch_size=settings.LOG_BATCH_SIZE
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 上流APIクライアントはフォーク後のワーカー内で作成する
+    rf_client.start()
+    claude_client.start()
+
+    # キャッシュスナップショットの復元（大きなファイルでもイベントループを止めないようスレッドで読む）と定期保存
+    snapshot_task = None
+    if settings.CACHE_SNAPSHOT_PATH:
+        await asyncio.to_thread(rf_cache.restore_snapshot)
+        snapshot_task = asyncio.create_task(
+            rf_cache.run_snapshot_loop(settings.CACHE_SNAPSHOT_INTERVAL)
+        )
+
+    yield
+
+    if snapshot_task is not None:
+        snapshot_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await snapshot_task
+        # ワーカー終了時に最新の状態を保存し、再起動後のウォームスタートに使う
+        # （キャンセル前に始まった定期保存のスレッドが残っていても、ロックで終わるのを待ってから書く）
+        rf_cache.save_snapshot()
+
+    await rf_client.aclose()
+    await claude_client.aclose()
 
 def create_app() -> FastAPI:
     app = FastAPI(
+        lifespan=lifespan,
         title="Claude MCP Server",
         description="Machine Conversation Protocol Server with Recorded Future Integration",
         version=settings.VERSION,
@@ -41,7 +75,8 @@ def create_app() -> FastAPI:
             status_code=exc.status_code,
             content={
                 "detail": exc.detail
-            }
+            },
+            headers=exc.headers
         )
 
     @app.exception_handler(Exception)
@@ -62,13 +97,9 @@ def create_app() -> FastAPI:
         allow_methods=["GET", "POST"],
         allow_headers=["*"],
     )
-    app.add_middleware(RequestMiddleware)
-
-    # セキュリティミドルウェアの追加
-    app.add_middleware(SecurityMiddleware)
 
-    # メンテナンスモードの設定
-    setup_maintenance_middleware(app)
+    # リクエストID・セキュリティ・メンテナンスモードをまとめた最外層のミドルウェア
+    app.add_middleware(GatewayMiddleware)
 
     # ルーターの追加
     app.include_router(router)
@@ -0,0 +1,67 @@
+"""公開サフィックスリスト（PSL）から app/services/public_suffix_data.py を生成する
+
+ICANNセクションのうち2ラベルまでのルール（TLD・co.uk のような第2レベル・*.ck のような
+ワイルドカードと例外）だけを、TLDごとに1行にまとめて埋め込む。
+それより深いルールは登録可能ドメインの境界を変えるだけで、ドメインかどうかの判定には影響しない。
+
+    curl -sO https://publicsuffix.org/list/public_suffix_list.dat
+    python -m tools.build_public_suffix public_suffix_list.dat
+"""
+import argparse
+from typing import Dict, List
+
+import idna
+
+OUTPUT = "app/services/public_suffix_data.py"
+
+def read_rules(path: str) -> List[str]:
+    rules, in_icann = [], False
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if "===BEGIN ICANN DOMAINS===" in line:
+                in_icann = True
+            elif "===END ICANN DOMAINS===" in line:
+                break
+            elif in_icann and line and not line.startswith("//"):
+                rules.append(line.split()[0])
+    return rules
+
+def to_ascii(label: str) -> str:
+    if label in ("*", "") or label.isascii():
+        return label.lower()
+    return idna.encode(label, uts46=True).decode("ascii")
+
+def group_rules(rules: List[str]) -> Dict[str, List[str]]:
+    # TLD -> 第2レベルのルール（"*" はワイルドカード、"!" 始まりは例外）
+    groups: Dict[str, List[str]] = {}
+    for rule in rules:
+        exception = rule.startswith("!")
+        labels = [to_ascii(label) for label in rule.lstrip("!").split(".")]
+        if len(labels) > 2:
+            continue
+        children = groups.setdefault(labels[-1], [])
+        if len(labels) == 2:
+            children.append(("!" if exception else "") + labels[0])
+    return groups
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="public_suffix_list.dat")
+    parser.add_argument("--output", default=OUTPUT)
+    args = parser.parse_args()
+
+    groups = group_rules(read_rules(args.source))
+    lines = [" ".join([tld, *sorted(set(children))]) for tld, children in sorted(groups.items())]
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write('"""公開サフィックスリストの埋め込みデータ（tools/build_public_suffix.py で生成。手で編集しない）\n\n')
+        f.write("https://publicsuffix.org/ のICANNセクションから2ラベルまでのルールを抜き出したもの（MPL 2.0）。\n")
+        f.write("1行が1つのTLDで、続く語はその下の公開サフィックス（* はワイルドカード、! は例外）。\n")
+        f.write('"""\n\n')
+        f.write("RULES = \"\"\"\\\n")
+        f.write("\n".join(lines))
+        f.write('\n"""\n')
+    print(f"{args.output}: {len(groups)} TLDs, {sum(len(c) for c in groups.values())} second-level rules")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Recorded Future APIのローカルスタブ
+
+オフラインでRFClientのバッチ処理・キャッシュ挙動を検証するためのサーバー。
+
+    uvicorn tools.rf_stub_server:app --port 8900
+    RF_API_BASE_URL=http://localhost:8900 python main.py
+
+STUB_LATENCY_MS でリクエストごとの疑似レイテンシを指定できる。
+値が "unknown" で始まる、または ".invalid" で終わるIOCは404を返す。
+"""
+import asyncio
+import hashlib
+import os
+from typing import Dict, List
+
+from fastapi import FastAPI, HTTPException
+
+app = FastAPI(title="Recorded Future Stub")
+
+LATENCY = float(os.getenv("STUB_LATENCY_MS", "50")) / 1000
+
+ENTITY_TYPES = {
+    "ip": "IpAddress",
+    "domain": "InternetDomainName",
+    "vulnerability": "CyberVulnerability",
+    "hash": "Hash"
+}
+
+stats: Dict[str, int] = {"single_requests": 0, "bulk_requests": 0, "entities": 0}
+
+def _is_unknown(value: str) -> bool:
+    return value.startswith("unknown") or value.endswith(".invalid")
+
+def _entity(ioc_type: str, value: str) -> Dict:
+    # 値から決定的にリスクスコアを生成する
+    digest = hashlib.sha256(f"{ioc_type}:{value}".encode()).digest()
+    return {
+        "entity": {"name": value, "type": ENTITY_TYPES[ioc_type]},
+        "risk": {"score": digest[0] * 100 // 255, "criticalityLabel": "Unusual"},
+        "timestamps": {"firstSeen": "2024-01-01T00:00:00.000Z"}
+    }
+
+@app.get("/{ioc_type}/{value}")
+async def lookup(ioc_type: str, value: str) -> Dict:
+    if ioc_type not in ENTITY_TYPES:
+        raise HTTPException(status_code=404, detail="Unknown entity type")
+    stats["single_requests"] += 1
+    stats["entities"] += 1
+    await asyncio.sleep(LATENCY)
+    if _is_unknown(value):
+        raise HTTPException(status_code=404, detail="Entity not found")
+    return _entity(ioc_type, value)
+
+@app.post("/soar/enrichment")
+async def bulk_lookup(payload: Dict[str, List[str]]) -> Dict:
+    stats["bulk_requests"] += 1
+    await asyncio.sleep(LATENCY)
+    results = []
+    for ioc_type, values in payload.items():
+        if ioc_type not in ENTITY_TYPES:
+            continue
+        stats["entities"] += len(values)
+        results.extend(_entity(ioc_type, v) for v in values if not _is_unknown(v))
+    return {"data": {"results": results}}
+
+@app.get("/_stats")
+async def get_stats() -> Dict[str, int]:
+    return stats